@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+    emmett_mongorest.cache
+    ----------------------
+
+    Provides caching utilities
+
+    :copyright: 2019 Giovanni Barillari
+    :license: BSD-3-Clause
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+def clone_data(data: Any) -> Any:
+    if isinstance(data, dict):
+        return {key: clone_data(val) for key, val in data.items()}
+    if isinstance(data, list):
+        return [clone_data(val) for val in data]
+    if isinstance(data, tuple):
+        return tuple(clone_data(val) for val in data)
+    return data
+
+
+def freeze_data(data: Any) -> Hashable:
+    #: values are tagged with their type, since `1`, `1.0` and `True`
+    #  hash the same but are different values for mongo
+    if isinstance(data, dict):
+        return (dict, tuple(
+            (key, freeze_data(val)) for key, val in data.items()
+        ))
+    if isinstance(data, (list, tuple)):
+        return (type(data), tuple(freeze_data(val) for val in data))
+    return (type(data), data)
+
+
+class LRUCache:
+    __slots__ = ['maxsize', 'hits', 'misses', '_data']
+
+    def __init__(self, maxsize: Optional[int] = 128):
+        self.maxsize = maxsize or 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def get(self, key: Hashable) -> Any:
+        try:
+            rv = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return rv
+
+    def set(self, key: Hashable, value: Any):
+        if not self.maxsize:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def info(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'maxsize': self.maxsize
+        }
+
+
+class MemoryCacheBackend:
+    __slots__ = ['maxsize', '_data']
+
+    def __init__(self, maxsize: Optional[int] = 256):
+        self.maxsize = maxsize or 0
+        self._data = OrderedDict()
+
+    async def get(self, key: Hashable) -> Any:
+        try:
+            expiration, rv = self._data[key]
+        except KeyError:
+            return None
+        if expiration < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return rv
+
+    async def set(self, key: Hashable, value: Any, ttl: int):
+        if not self.maxsize:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def clear(self):
+        self._data.clear()
+
+    def info(self) -> Dict[str, int]:
+        return {'size': len(self._data), 'maxsize': self.maxsize}
+
+
+class ResultCache:
+    __slots__ = ['backend', 'ttl', 'hits', 'misses', '_generation']
+
+    def __init__(self, backend: Any, ttl: Optional[int] = 0):
+        self.backend = backend
+        self.ttl = ttl or 0
+        self.hits = 0
+        self.misses = 0
+        self._generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    async def fetch(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        if not self.enabled:
+            return await loader()
+        rv = await self.backend.get(key)
+        if rv is not None:
+            self.hits += 1
+            return clone_data(rv)
+        self.misses += 1
+        generation = self._generation
+        rv = await loader()
+        #: skip storing results of reads racing with writes
+        if generation == self._generation:
+            await self.backend.set(key, clone_data(rv), self.ttl)
+        return rv
+
+    async def invalidate(self):
+        self._generation += 1
+        await self.backend.clear()
+
+    def info(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'ttl': self.ttl,
+            **self.backend.info()
+        }
+
+
+class SingleFlight:
+    __slots__ = ['shared', '_calls']
+
+    def __init__(self):
+        self.shared = 0
+        self._calls = {}
+
+    async def do(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        task = self._calls.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            task = self._calls[key] = asyncio.ensure_future(loader())
+            task.add_done_callback(lambda _: self._forget(key, task))
+        #: callers are isolated from each other's changes to the result,
+        #  and from each other's cancellation
+        return clone_data(await asyncio.shield(task))
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def info(self) -> Dict[str, int]:
+        return {'shared': self.shared, 'in_flight': len(self._calls)}
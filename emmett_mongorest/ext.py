@@ -18,6 +18,9 @@ from emmett_rest import REST
 from emmett_rest.wrappers import wrap_method_on_obj
 
 from .docs import ApiDocs, ApiDocsModule
+from .indexes import register_command as _register_indexes_command
+from .limits import build_limits
+from .metrics import MetricsModule, RESTMetrics
 from .parsers import Parser
 from .rest import MongoRESTModule
 from .serializers import Serializer
@@ -32,7 +35,39 @@ class MongoREST(REST):
             default_serializer=Serializer,
             default_parser=Parser,
             id_path="/<str:rid>",
-            geo_near_max_distance=250_000
+            geo_near_max_distance=250_000,
+            pagination_mode="offset",
+            cursor_param="cursor",
+            count_mode="exact",
+            count_cap=10_000,
+            index_query_mode="sequential",
+            use_projection=False,
+            query_cache_size=128,
+            export_batch_size=1000,
+            export_format="ndjson",
+            bulk_max_size=1000,
+            refetch_on_create=False,
+            atomic_delete=True,
+            use_etag=False,
+            etag_field=None,
+            aggregation_cache_ttl=0,
+            aggregation_cache_size=256,
+            aggregation_cache_backend=None,
+            coalesce_reads=False,
+            slow_query_threshold=None,
+            slow_query_explain_rate=0.0,
+            explain_header="x-mongorest-explain",
+            server_timing=False,
+            timing_sink=None,
+            use_metrics=False,
+            max_time_ms=None,
+            max_time_ms_routes={},
+            concurrency_limits={},
+            global_concurrency_limits={},
+            concurrency_queue_size=0,
+            concurrency_retry_after=1,
+            concurrency_reject_status=503,
+            response_formats=[]
         )
     }
 
@@ -44,6 +79,12 @@ class MongoREST(REST):
         )
         self._docs_modules = {}
         self.docs = ApiDocs(self)
+        self.metrics = RESTMetrics()
+        self.limits = build_limits(
+            self.config.global_concurrency_limits,
+            self.config.concurrency_queue_size
+        )
+        _register_indexes_command(self)
 
     def docs_module(
         self,
@@ -60,3 +101,18 @@ class MongoREST(REST):
         )
         self._docs_modules[name] = rv
         return rv
+
+    def metrics_module(
+        self,
+        import_name: str,
+        name: str = "metrics",
+        **kwargs: Any
+    ) -> MetricsModule:
+        rv = self.app.module(
+            import_name,
+            name,
+            module_class=MetricsModule,
+            **kwargs
+        )
+        rv._init(self)
+        return rv
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+    emmett_mongorest.formats
+    ------------------------
+
+    Provides binary response formats and Accept negotiation
+
+    :copyright: 2019 Giovanni Barillari
+    :license: BSD-3-Clause
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime, time, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Optional
+
+import bson
+
+from bson.codec_options import CodecOptions, TypeRegistry
+from bson.decimal128 import Decimal128
+from bson.objectid import ObjectId
+from emmett import request, response
+from emmett_rest.helpers import ModulePipe
+
+from .http import HTTPBytes
+from .profiling import timing
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+#: msgpack extension type used for ObjectId values (12 raw bytes)
+OBJECTID_EXT_TYPE = 1
+
+
+def _msgpack_default(obj: Any) -> Any:
+    if isinstance(obj, ObjectId):
+        return msgpack.ExtType(OBJECTID_EXT_TYPE, obj.binary)
+    if isinstance(obj, datetime):
+        #: naive datetimes from mongo are in UTC
+        return msgpack.Timestamp.from_datetime(
+            obj if obj.tzinfo else obj.replace(tzinfo=timezone.utc)
+        )
+    if isinstance(obj, (date, time)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, Decimal128):
+        return float(obj.to_decimal())
+    raise TypeError(f'{type(obj).__name__} is not msgpack serializable')
+
+
+def _bson_fallback(obj: Any) -> Any:
+    if isinstance(obj, (date, time)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return Decimal128(obj)
+    return obj
+
+
+_bson_codec_options = CodecOptions(
+    type_registry=TypeRegistry(fallback_encoder=_bson_fallback)
+)
+
+
+def encode_msgpack(data: Any) -> bytes:
+    return msgpack.packb(data, default=_msgpack_default, use_bin_type=True)
+
+
+def encode_bson(data: Dict[str, Any]) -> bytes:
+    return bson.encode(data, codec_options=_bson_codec_options)
+
+
+formats = {
+    'msgpack': (
+        ('application/msgpack', 'application/x-msgpack'), encode_msgpack
+    ),
+    'bson': (('application/bson',), encode_bson)
+}
+
+
+def build_formats(names: Iterable[str]) -> Dict[str, Optional[str]]:
+    rv = {'application/json': None, 'application/*': None, '*/*': None}
+    for name in names or []:
+        if name not in formats:
+            raise ValueError(f'unsupported response format {name}')
+        if name == 'msgpack' and msgpack is None:
+            raise RuntimeError(
+                'msgpack responses require the msgpack package, '
+                'install emmett-mongorest with the msgpack extra'
+            )
+        for media_type in formats[name][0]:
+            rv[media_type] = name
+    return rv
+
+
+def negotiate(
+    accept: Optional[str],
+    available: Dict[str, Optional[str]]
+) -> Optional[str]:
+    rv, best = None, 0.0
+    for item in (accept or '').split(','):
+        media_type, *params = item.split(';')
+        media_type = media_type.strip().lower()
+        if media_type not in available:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, val = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(val)
+                except ValueError:
+                    quality = 0.0
+        #: on equal quality the first listed type wins
+        if quality > best:
+            rv, best = available[media_type], quality
+    return rv
+
+
+class FormatPipe(ModulePipe):
+    def __init__(self, mod, available: Dict[str, Optional[str]]):
+        super().__init__(mod)
+        self.available = available
+
+    async def pipe_request(self, next_pipe, **kwargs):
+        response.headers['vary'] = 'accept'
+        name = negotiate(request.headers.get('accept'), self.available)
+        rv = await next_pipe(**kwargs)
+        if name is None or not isinstance(rv, dict):
+            return rv
+        media_types, encoder = formats[name]
+        response.headers['content-type'] = media_types[0]
+        with timing(name):
+            body = encoder(rv)
+        raise HTTPBytes(
+            response.status,
+            body,
+            headers=response.headers,
+            cookies=response.cookies
+        )
@@ -9,9 +9,13 @@
     :license: BSD-3-Clause
 """
 
+import hashlib
+
 from bson.errors import InvalidId
 from bson.objectid import ObjectId
 from emmett import request, response
+from emmett.http import HTTP
+from emmett.serializers import Serializers
 from emmett_rest.helpers import (
     ModulePipe,
     FieldPipe as _FieldPipe,
@@ -19,13 +23,113 @@ from emmett_rest.helpers import (
     SetFetcher as _SetFetcher,
     RecordFetcher as _RecordFetcher
 )
+from pymongo.errors import ExecutionTimeout
+
+_json_dump = Serializers.get_for('json')
+
+
+def build_projection(fields):
+    rv = {}
+    #: parents first, so nested paths covered by them can be dropped
+    for field in sorted(set(fields), key=len):
+        if any(field.startswith(key + '.') for key in rv):
+            continue
+        rv[field] = 1
+    return rv
+
+
+def _values_equal(a, b):
+    #: strict on types, since BSON would store `1`, `1.0` and `True`
+    #  as different values
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(
+            _values_equal(a[key], b[key]) for key in a
+        )
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(
+            _values_equal(x, y) for x, y in zip(a, b)
+        )
+    return a == b
+
+
+def _is_plain_key(key):
+    return (
+        isinstance(key, str) and bool(key) and
+        '.' not in key and not key.startswith('$')
+    )
+
+
+def _diff_values(path, old, new, set_ops, unset_ops):
+    if (
+        isinstance(old, dict) and isinstance(new, dict) and
+        all(_is_plain_key(key) for key in old) and
+        all(_is_plain_key(key) for key in new)
+    ):
+        for key, value in new.items():
+            if key not in old:
+                set_ops[f'{path}.{key}'] = value
+            else:
+                _diff_values(
+                    f'{path}.{key}', old[key], value, set_ops, unset_ops
+                )
+        for key in old.keys() - new.keys():
+            unset_ops[f'{path}.{key}'] = ''
+    elif not _values_equal(old, new):
+        set_ops[path] = new
+
+
+def build_update_diff(row, data):
+    set_ops, unset_ops = {}, {}
+    for key, value in data.items():
+        if key not in row:
+            set_ops[key] = value
+        else:
+            _diff_values(key, row[key], value, set_ops, unset_ops)
+    rv = {}
+    if set_ops:
+        rv['$set'] = set_ops
+    if unset_ops:
+        rv['$unset'] = unset_ops
+    return rv
+
+
+def build_etag(data):
+    data = _json_dump(data)
+    if isinstance(data, str):
+        data = data.encode('utf8')
+    return f'"{hashlib.sha1(data).hexdigest()}"'
+
+
+def variant_etag(etag, variant):
+    #: representations negotiated via Accept need their own strong tags
+    if not variant:
+        return etag
+    return f'{etag[:-1]}-{variant}"'
+
+
+def etag_matches(etag, header):
+    if not header:
+        return False
+    for tag in header.split(','):
+        tag = tag.strip()
+        #: if-none-match uses weak comparison
+        if tag == '*' or tag.replace('W/', '', 1) == etag:
+            return True
+    return False
 
 
 class MongoQuery(object):
-    __slots__ = ['stack']
+    __slots__ = ['stack', 'projection', 'where_condition', 'coalesce']
 
-    def __init__(self, initial=None):
+    def __init__(self, initial=None, projection=None):
         self.stack = initial or []
+        self.projection = projection
+        #: the condition compiled from the `where` param, if any
+        self.where_condition = None
+        #: whether the fetch can be shared with identical in-flight reads
+        self.coalesce = False
 
     def where(self, *conditions):
         for condition in conditions:
@@ -64,6 +168,10 @@ class RecordQueryBuilder(ModulePipe):
 
 
 class RecordFetcher(_RecordFetcher):
+    def __init__(self, mod, coalesce=False):
+        super().__init__(mod)
+        self.coalesce = coalesce
+
     async def pipe_request(self, next_pipe, **kwargs):
         await self.fetch_record(kwargs)
         if not kwargs['row']:
@@ -72,6 +180,8 @@ class RecordFetcher(_RecordFetcher):
         return await next_pipe(**kwargs)
 
     async def fetch_record(self, kwargs):
+        #: writes need a fresh pre-image, so only reads can share fetches
+        kwargs['query'].coalesce = self.coalesce
         kwargs['row'] = await self.mod._select_method(kwargs['query'])
         del kwargs['query']
 
@@ -92,3 +202,80 @@ class FieldsPipe(_FieldsPipe):
             ) or ''
         ).split(',')
         return list(self._accepted_set & set(pfields))
+
+
+class ProjectionPipe(FieldsPipe):
+    def __init__(
+        self,
+        mod,
+        accepted_attr_name='_serializable_fields',
+        query_param_name='fields',
+        arg='fields'
+    ):
+        super().__init__(mod, accepted_attr_name, query_param_name, arg)
+
+    async def pipe_request(self, next_pipe, **kwargs):
+        fields = None
+        if request.query_params[self.param_name]:
+            fields = self.parse_fields()
+            if not fields:
+                response.status = 400
+                return self.mod.build_error_400({
+                    self.param_name: 'invalid value'
+                })
+            kwargs[self.arg_name] = fields
+        kwargs['query'].projection = self.mod.get_projection(fields)
+        return await next_pipe(**kwargs)
+
+
+class ETagPipe(ModulePipe):
+    def __init__(self, mod, record=False):
+        super().__init__(mod)
+        self.record = record
+
+    def check(self, etag):
+        if etag_matches(etag, request.headers.get('if-none-match')):
+            raise HTTP(304, headers={'etag': etag})
+
+    async def pipe_request(self, next_pipe, **kwargs):
+        if not self.mod.use_etag:
+            return await next_pipe(**kwargs)
+        variant = self.mod.get_response_format()
+        if (
+            self.record and self.mod.etag_field and
+            request.headers.get('if-none-match') and
+            #: custom fetchers may enforce access rules, so they need to run
+            self.mod._select_method == self.mod._get_row
+        ):
+            #: version based tags let us skip fetch and serialization
+            etag = await self.mod.get_record_etag(kwargs['query'])
+            if etag:
+                self.check(variant_etag(etag, variant))
+        rv = await next_pipe(**kwargs)
+        if response.status != 200:
+            return rv
+        #: the read handler sets version based tags from the fetched row
+        etag = variant_etag(
+            response.headers.get('etag') or build_etag(rv), variant
+        )
+        self.check(etag)
+        response.headers['etag'] = etag
+        return rv
+
+
+class QueryTimeoutPipe(ModulePipe):
+    def __init__(self, mod, route):
+        super().__init__(mod)
+        self.route = route
+
+    async def pipe_request(self, next_pipe, **kwargs):
+        try:
+            return await next_pipe(**kwargs)
+        except ExecutionTimeout:
+            if self.mod.use_metrics:
+                self.mod.ext.metrics.inc(
+                    'query_timeouts_total',
+                    (('module', self.mod.name), ('route', self.route))
+                )
+            response.status = 503
+            return self.mod.error_503({'query': 'execution timeout'})
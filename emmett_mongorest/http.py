@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+    emmett_mongorest.http
+    ---------------------
+
+    Provides additional HTTP responses
+
+    :copyright: 2019 Giovanni Barillari
+    :license: BSD-3-Clause
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+from contextvars import copy_context
+from inspect import isawaitable
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List
+
+from emmett.http import HTTPResponse
+
+
+class HTTPStream(HTTPResponse):
+    def __init__(
+        self,
+        status_code: int,
+        chunks: AsyncIterator[bytes],
+        *,
+        headers: Dict[str, str] = {'content-type': 'text/plain'},
+        cookies: Dict[str, Any] = {}
+    ):
+        super().__init__(status_code, headers=headers, cookies=cookies)
+        self.chunks = chunks
+        #: chunks are produced within the context of the raising request,
+        #  so per-request tracking keeps working while streaming
+        self._context = copy_context()
+        self._close_callbacks: List[Callable[[], Any]] = []
+        self._closed = False
+
+    def on_close(self, f: Callable[[], Any]) -> Callable[[], Any]:
+        self._close_callbacks.append(f)
+        return f
+
+    async def close(self):
+        #: runs once, whether the body was fully sent or sending failed
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            aclose = getattr(self.chunks, 'aclose', None)
+            if aclose is not None:
+                await aclose()
+        finally:
+            for callback in reversed(self._close_callbacks):
+                rv = callback()
+                if isawaitable(rv):
+                    await rv
+
+    async def _send_headers(self, send):
+        try:
+            await super()._send_headers(send)
+        except BaseException:
+            await self.close()
+            raise
+
+    def _next_chunk(self) -> Awaitable[bytes]:
+        return self._context.run(
+            asyncio.ensure_future, self.chunks.__anext__()
+        )
+
+    async def _send_body(self, send):
+        try:
+            while True:
+                try:
+                    chunk = await self._next_chunk()
+                except StopAsyncIteration:
+                    break
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True
+                })
+            await send({
+                'type': 'http.response.body',
+                'body': b'',
+                'more_body': False
+            })
+        finally:
+            await self.close()
+
+
+class HTTPBytes(HTTPResponse):
+    def __init__(
+        self,
+        status_code: int,
+        body: bytes,
+        *,
+        headers: Dict[str, str] = {'content-type': 'application/octet-stream'},
+        cookies: Dict[str, Any] = {}
+    ):
+        super().__init__(status_code, headers=headers, cookies=cookies)
+        self.body = body
+
+    async def _send_body(self, send):
+        await send({
+            'type': 'http.response.body',
+            'body': self.body,
+            'more_body': False
+        })
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+    emmett_mongorest.indexes
+    ------------------------
+
+    Provides indexes audit utilities
+
+    :copyright: 2019 Giovanni Barillari
+    :license: BSD-3-Clause
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+from typing import Any, Dict, List, Tuple
+
+import click
+
+IndexKeys = List[Tuple[str, Any]]
+
+_indexed_by_default = {'_id', 'id'}
+
+
+def parse_sort(sort: str) -> IndexKeys:
+    rv = []
+    for field in (sort or '').split(','):
+        direction = 1
+        if field.startswith('-'):
+            field = field[1:]
+            direction = -1
+        if not field:
+            continue
+        rv.append(('_id' if field == 'id' else field, direction))
+    return rv
+
+
+class IndexAdvisor:
+    def __init__(self, mod: Any):
+        self.mod = mod
+
+    async def get_indexes(self) -> List[IndexKeys]:
+        info = await self.mod.collection.index_information()
+        return [list(index['key']) for index in info.values()]
+
+    @staticmethod
+    def _prefixed_by(indexes: List[IndexKeys], field: str) -> bool:
+        return field in _indexed_by_default or any(
+            index[0][0] == field for index in indexes if index
+        )
+
+    def _default_sort_keys(self) -> IndexKeys:
+        rv = [
+            (field, direction)
+            for field, direction in parse_sort(self.mod.default_sort)
+            if field != '_id'
+        ]
+        #: keyset pagination always uses `_id` as tiebreaker
+        if self.mod.pagination_mode == 'keyset' or not rv:
+            rv.append(('_id', rv[0][1] if rv else 1))
+        return rv
+
+    def analyze(self, indexes: List[IndexKeys]) -> Dict[str, Any]:
+        filters = {
+            field: self._prefixed_by(indexes, field)
+            for field in self.mod.query_allowed_fields
+        }
+        sorts = {
+            field: self._prefixed_by(indexes, field)
+            for field in self.mod.allowed_sorts
+        }
+        #: aggregations read every matched document anyway, an index just
+        #  lets mongo cover them, so these get no suggestions
+        groups = {
+            field: self._prefixed_by(indexes, field)
+            for field in self.mod._groupable_fields or []
+        }
+        stats = {
+            field: self._prefixed_by(indexes, field)
+            for field in self.mod._statsable_fields or []
+        }
+        #: equality filters first, then the default sort (ESR rule)
+        sort_keys = self._default_sort_keys()
+        sort_directions = dict(sort_keys)
+        suggestions = []
+        for field, indexed in filters.items():
+            if indexed:
+                continue
+            suggestions.append(
+                [(field, sort_directions.get(field, 1))] +
+                [key for key in sort_keys if key[0] != field]
+            )
+        for field, indexed in sorts.items():
+            if indexed or any(keys[0][0] == field for keys in suggestions):
+                continue
+            keys = [(field, 1)]
+            if self.mod.pagination_mode == 'keyset':
+                keys.append(('_id', 1))
+            suggestions.append(keys)
+        return {
+            'collscan_filters': [
+                field for field, indexed in filters.items() if not indexed
+            ],
+            'blocking_sorts': [
+                field for field, indexed in sorts.items() if not indexed
+            ],
+            'uncovered_groups': [
+                field for field, indexed in groups.items() if not indexed
+            ],
+            'uncovered_stats': [
+                field for field, indexed in stats.items() if not indexed
+            ],
+            'suggestions': [
+                keys for keys in suggestions if keys not in indexes
+            ]
+        }
+
+    async def audit(self) -> Dict[str, Any]:
+        return self.analyze(await self.get_indexes())
+
+    async def create_missing(self) -> List[str]:
+        report = await self.audit()
+        rv = []
+        for keys in report['suggestions']:
+            rv.append(
+                await self.mod.collection.create_index(keys, background=True)
+            )
+        return rv
+
+
+def _format_keys(keys: IndexKeys) -> str:
+    return ', '.join(f'{field}: {direction}' for field, direction in keys)
+
+
+def _build_cmd_wrapper(ext):
+    def cmd(module, create):
+        mod = ext.app._modules[module]
+        advisor = IndexAdvisor(mod)
+        loop = asyncio.get_event_loop()
+        report = loop.run_until_complete(advisor.audit())
+        for field in report['collscan_filters']:
+            click.echo(f'filter on "{field}" would require a COLLSCAN')
+        for field in report['blocking_sorts']:
+            click.echo(f'sort on "{field}" would require an in-memory SORT')
+        for field in report['uncovered_groups']:
+            click.echo(f'grouping on "{field}" would scan whole documents')
+        for field in report['uncovered_stats']:
+            click.echo(f'stats on "{field}" would scan whole documents')
+        for keys in report['suggestions']:
+            click.echo(f'suggested index: {{{_format_keys(keys)}}}')
+        if not report['suggestions']:
+            click.echo('no missing indexes')
+        elif create:
+            for name in loop.run_until_complete(advisor.create_missing()):
+                click.echo(f'created index {name}')
+    return cmd
+
+
+def register_command(ext):
+    ext.app.command(
+        "mongorest_indexes", help="Audit indexes of a REST module"
+    )(
+        click.argument("module")(
+            click.option(
+                "--create", is_flag=True, default=False,
+                help="Create missing indexes in background"
+            )(_build_cmd_wrapper(ext))
+        )
+    )
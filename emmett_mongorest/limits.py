@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+    emmett_mongorest.limits
+    -----------------------
+
+    Provides concurrency limits and load shedding
+
+    :copyright: 2019 Giovanni Barillari
+    :license: BSD-3-Clause
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+from collections import deque
+from functools import partial
+from typing import Any, Dict, List, Optional
+
+from emmett import response
+from emmett.pipeline import Pipe
+
+from .http import HTTPStream
+
+routes_kinds = {
+    'index': 'read',
+    'read': 'read',
+    'export': 'read',
+    'group': 'aggregate',
+    'stats': 'aggregate',
+    'sample': 'aggregate',
+    'create': 'write',
+    'update': 'write',
+    'delete': 'write',
+    'bulk_create': 'write',
+    'bulk_update': 'write',
+    'bulk_delete': 'write'
+}
+
+
+class ConcurrencyLimit:
+    __slots__ = [
+        'concurrency', 'queue_size', 'active', 'queued', 'rejected',
+        '_waiters'
+    ]
+
+    def __init__(self, concurrency: int, queue_size: int = 0):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+        self._waiters = deque()
+
+    async def acquire(self) -> bool:
+        if self.active < self.concurrency and not self._waiters:
+            self.active += 1
+            return True
+        if len(self._waiters) >= self.queue_size:
+            self.rejected += 1
+            return False
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                #: the slot was handed over right before cancellation
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+        return True
+
+    def release(self):
+        #: slots are handed over to waiters without being released
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def info(self) -> Dict[str, int]:
+        return {
+            'concurrency': self.concurrency,
+            'active': self.active,
+            'waiting': len(self._waiters),
+            'queued': self.queued,
+            'rejected': self.rejected
+        }
+
+
+def build_limits(
+    config: Optional[Dict[str, int]],
+    queue_size: int
+) -> Dict[str, ConcurrencyLimit]:
+    return {
+        kind: ConcurrencyLimit(concurrency, queue_size)
+        for kind, concurrency in (config or {}).items()
+        if concurrency
+    }
+
+
+class LimiterPipe(Pipe):
+    def __init__(self, mod: Any, route: str):
+        self.mod = mod
+        self.route = route
+
+    def _reject(self):
+        if self.mod.use_metrics:
+            self.mod.ext.metrics.inc(
+                'requests_rejected_total',
+                (('module', self.mod.name), ('route', self.route))
+            )
+        response.status = self.mod.concurrency_reject_status
+        response.headers['retry-after'] = str(
+            self.mod.concurrency_retry_after
+        )
+        return self.mod.error_503({'request': 'too many requests'})
+
+    async def pipe_request(self, next_pipe, **kwargs):
+        #: limits are resolved per request, so modules can change them
+        limits = self.mod._route_limits(self.route)
+        if not limits:
+            return await next_pipe(**kwargs)
+        acquired = []
+        try:
+            for limit in limits:
+                if not await limit.acquire():
+                    return self._reject()
+                acquired.append(limit)
+            return await next_pipe(**kwargs)
+        except HTTPStream as exc:
+            #: streamed bodies keep their slots until they are fully sent
+            exc.on_close(partial(self._release, acquired))
+            acquired = []
+            raise
+        finally:
+            self._release(acquired)
+
+    @staticmethod
+    def _release(limits: List[ConcurrencyLimit]):
+        for limit in reversed(limits):
+            limit.release()
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+    emmett_mongorest.metrics
+    ------------------------
+
+    Provides in-process metrics and Prometheus exposition
+
+    :copyright: 2019 Giovanni Barillari
+    :license: BSD-3-Clause
+"""
+
+from __future__ import annotations
+
+import time
+
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import partial
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from emmett import AppModule, response
+from emmett.pipeline import Pipe
+
+from .http import HTTPStream
+
+Labels = Tuple[Tuple[str, str], ...]
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+COMMANDS_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50)
+DOCUMENTS_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class Histogram:
+    __slots__ = ['buckets', 'counts', 'sum', 'count']
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        rv, total = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            rv.append((_format_value(bound), total))
+        rv.append(('+Inf', self.count))
+        return rv
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n'
+    )
+
+
+def _format_labels(labels: Labels, extra: Optional[str] = None) -> str:
+    rv = [f'{key}="{_escape(val)}"' for key, val in labels]
+    if extra:
+        rv.append(extra)
+    return '{' + ','.join(rv) + '}' if rv else ''
+
+
+class MetricsRegistry:
+    prefix = 'mongorest'
+
+    def __init__(self):
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.descriptions: Dict[str, str] = {}
+
+    def describe(self, name: str, description: str):
+        self.descriptions[name] = description
+
+    def inc(self, name: str, labels: Labels, value: float = 1):
+        data = self.counters.setdefault(name, {})
+        data[labels] = data.get(labels, 0) + value
+
+    def observe(
+        self,
+        name: str,
+        labels: Labels,
+        value: float,
+        buckets: Sequence[float]
+    ):
+        data = self.histograms.setdefault(name, {})
+        try:
+            histogram = data[labels]
+        except KeyError:
+            histogram = data[labels] = Histogram(buckets)
+        histogram.observe(value)
+
+    def _render_header(self, lines: List[str], name: str, kind: str):
+        full_name = f'{self.prefix}_{name}'
+        if name in self.descriptions:
+            lines.append(f'# HELP {full_name} {self.descriptions[name]}')
+        lines.append(f'# TYPE {full_name} {kind}')
+        return full_name
+
+    def render(self) -> str:
+        lines = []
+        for name, data in self.counters.items():
+            full_name = self._render_header(lines, name, 'counter')
+            for labels, value in data.items():
+                lines.append(
+                    f'{full_name}{_format_labels(labels)} '
+                    f'{_format_value(value)}'
+                )
+        for name, data in self.histograms.items():
+            full_name = self._render_header(lines, name, 'histogram')
+            for labels, histogram in data.items():
+                for bound, count in histogram.cumulative():
+                    le = f'le="{bound}"'
+                    lines.append(
+                        f'{full_name}_bucket{_format_labels(labels, le)} '
+                        f'{count}'
+                    )
+                lines.append(
+                    f'{full_name}_sum{_format_labels(labels)} '
+                    f'{_format_value(histogram.sum)}'
+                )
+                lines.append(
+                    f'{full_name}_count{_format_labels(labels)} '
+                    f'{histogram.count}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+class RequestStats:
+    __slots__ = ['commands', 'documents']
+
+    def __init__(self):
+        self.commands = 0
+        self.documents = 0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    '_mongorest_request_stats', default=None
+)
+
+
+def track_commands(value: int = 1):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.commands += value
+
+
+def track_documents(value: int):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.documents += value
+
+
+class MetricsPipe(Pipe):
+    def __init__(self, mod: Any, route: str):
+        self.mod = mod
+        self.labels = (('module', mod.name), ('route', route))
+
+    def _record(self, status: int, start: float, stats: RequestStats):
+        self.mod.ext.metrics.record_request(
+            self.labels, status, time.perf_counter() - start, stats
+        )
+
+    async def pipe_request(self, next_pipe, **kwargs):
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        status = 500
+        try:
+            rv = await next_pipe(**kwargs)
+            status = response.status
+            return rv
+        except HTTPStream as exc:
+            #: streamed bodies keep tracking until they are fully sent
+            exc.on_close(partial(self._record, exc.status_code, start, stats))
+            status = None
+            raise
+        except Exception as exc:
+            #: HTTP responses raised from pipes or handlers
+            status = getattr(exc, 'status_code', 500)
+            raise
+        finally:
+            _request_stats.reset(token)
+            if status is not None:
+                self._record(status, start, stats)
+
+
+class RESTMetrics(MetricsRegistry):
+    def __init__(self):
+        super().__init__()
+        self.describe('requests_total', 'Requests handled by REST modules')
+        self.describe(
+            'request_duration_seconds', 'Requests latency in seconds'
+        )
+        self.describe(
+            'request_mongo_commands', 'Mongo commands issued per request'
+        )
+        self.describe(
+            'request_documents', 'Documents returned per request'
+        )
+        self.describe(
+            'query_timeouts_total', 'Mongo queries exceeding maxTimeMS'
+        )
+        self.describe(
+            'requests_rejected_total', 'Requests shed by concurrency limits'
+        )
+
+    def record_request(
+        self,
+        labels: Labels,
+        status: int,
+        duration: float,
+        stats: RequestStats
+    ):
+        self.inc('requests_total', labels + (('status', str(status)),))
+        self.observe(
+            'request_duration_seconds', labels, duration, LATENCY_BUCKETS
+        )
+        self.observe(
+            'request_mongo_commands', labels, stats.commands, COMMANDS_BUCKETS
+        )
+        self.observe(
+            'request_documents', labels, stats.documents, DOCUMENTS_BUCKETS
+        )
+
+
+class MetricsModule(AppModule):
+    def _init(self, ext):
+        self.ext = ext
+        self.route("/", name="render", output="str")(self._render)
+
+    def _render(self):
+        response.content_type = "text/plain; version=0.0.4; charset=utf-8"
+        return self.ext.metrics.render()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+    emmett_mongorest.pagination
+    ---------------------------
+
+    Provides keyset pagination helpers
+
+    :copyright: 2019 Giovanni Barillari
+    :license: BSD-3-Clause
+"""
+
+from __future__ import annotations
+
+import base64
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import json_util
+
+SortSpec = List[Tuple[str, int]]
+
+
+def keyset_sort(sort: SortSpec) -> SortSpec:
+    rv = list(sort)
+    if not any(field == '_id' for field, _ in rv):
+        rv.append(('_id', rv[-1][1] if rv else 1))
+    return rv
+
+
+def invert_sort(sort: SortSpec) -> SortSpec:
+    return [(field, -direction) for field, direction in sort]
+
+
+def get_path(row: Dict[str, Any], path: str) -> Any:
+    rv = row
+    for key in path.split('.'):
+        if not isinstance(rv, dict):
+            return None
+        rv = rv.get(key)
+    return rv
+
+
+def encode_cursor(sort: SortSpec, row: Dict[str, Any], direction: str) -> str:
+    data = {
+        's': [[field, val] for field, val in sort],
+        'v': [get_path(row, field) for field, _ in sort],
+        'd': direction
+    }
+    return base64.urlsafe_b64encode(
+        json_util.dumps(data).encode('utf8')
+    ).decode('utf8').rstrip('=')
+
+
+def decode_cursor(sort: SortSpec, token: str) -> Dict[str, Any]:
+    try:
+        data = json_util.loads(
+            base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        )
+        assert isinstance(data, dict)
+        assert data['d'] in ('next', 'prev')
+        assert [tuple(el) for el in data['s']] == sort
+        assert isinstance(data['v'], list) and len(data['v']) == len(sort)
+    except Exception:
+        raise ValueError('Invalid cursor')
+    return {'direction': data['d'], 'values': data['v']}
+
+
+def _range_condition(
+    field: str,
+    value: Any,
+    direction: int
+) -> Dict[str, Any]:
+    #: null values sort before everything else in MongoDB
+    if value is None:
+        return {field: {'$ne': None} if direction > 0 else {'$lt': None}}
+    if direction > 0:
+        return {field: {'$gt': value}}
+    #: `$lt` never matches null or missing fields, which come last here
+    return {'$or': [{field: {'$lt': value}}, {field: None}]}
+
+
+def keyset_condition(
+    sort: SortSpec,
+    values: List[Any],
+    backwards: bool = False
+) -> Dict[str, Any]:
+    branches = []
+    for idx, (field, direction) in enumerate(sort):
+        branch = {
+            sort[pos][0]: values[pos] for pos in range(idx)
+        }
+        branch.update(_range_condition(
+            field, values[idx], -direction if backwards else direction
+        ))
+        branches.append(branch)
+    return {'$or': branches}
+
+
+def build_cursors(
+    sort: SortSpec,
+    rows: List[Dict[str, Any]],
+    has_more: bool,
+    cursor_data: Optional[Dict[str, Any]]
+) -> Dict[str, Optional[str]]:
+    rv = {'next': None, 'prev': None}
+    if not rows:
+        return rv
+    backwards = bool(cursor_data) and cursor_data['direction'] == 'prev'
+    if has_more or backwards:
+        rv['next'] = encode_cursor(sort, rows[-1], 'next')
+    if cursor_data and (has_more or not backwards):
+        rv['prev'] = encode_cursor(sort, rows[0], 'prev')
+    return rv
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+    emmett_mongorest.profiling
+    --------------------------
+
+    Provides queries profiling utilities
+
+    :copyright: 2019 Giovanni Barillari
+    :license: BSD-3-Clause
+"""
+
+from __future__ import annotations
+
+import random
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial, wraps
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from emmett import request, response
+from emmett.pipeline import Pipe
+from emmett.serializers import Serializers
+from pymongo.errors import ExecutionTimeout
+
+from .http import HTTPBytes, HTTPStream
+from .metrics import track_commands
+
+_json_dump = Serializers.get_for('json')
+
+
+def query_shape(data: Any) -> Any:
+    if isinstance(data, dict):
+        return {key: query_shape(val) for key, val in data.items()}
+    if isinstance(data, (list, tuple)):
+        if data and all(isinstance(val, (dict, list)) for val in data):
+            return [query_shape(val) for val in data]
+    return '?'
+
+
+def plan_stages(plan: Dict[str, Any]) -> List[str]:
+    rv, stack = [], [plan]
+    while stack:
+        node = stack.pop()
+        if 'stage' in node:
+            rv.append(node['stage'])
+        if 'inputStage' in node:
+            stack.append(node['inputStage'])
+        stack.extend(reversed(node.get('inputStages', [])))
+    return rv
+
+
+def _winning_plan(explain: Dict[str, Any]) -> Dict[str, Any]:
+    if 'queryPlanner' in explain:
+        return explain['queryPlanner'].get('winningPlan', {})
+    #: aggregations report the plan of the initial `$cursor` stage
+    for stage in explain.get('stages', []):
+        if '$cursor' in stage:
+            return _winning_plan(stage['$cursor'])
+    return {}
+
+
+def summarize_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    stages = plan_stages(_winning_plan(explain))
+    return {
+        'stages': stages,
+        'collscan': 'COLLSCAN' in stages,
+        'blocking_sort': 'SORT' in stages
+    }
+
+
+class SlowQueryLog:
+    plan_header = 'x-mongorest-plan'
+
+    def __init__(
+        self,
+        mod: Any,
+        threshold: Optional[float] = None,
+        explain_rate: float = 0.0,
+        explain_header: Optional[str] = None
+    ):
+        self.mod = mod
+        self.threshold = threshold
+        self.explain_rate = explain_rate
+        self.explain_header = explain_header
+
+    def _explain_requested(self) -> bool:
+        return bool(
+            self.explain_header and self.mod.app.debug and
+            request.headers.get(self.explain_header)
+        )
+
+    async def observe(
+        self,
+        kind: str,
+        query: Any,
+        sort: Any,
+        loader: Callable[[], Awaitable[Any]],
+        explainer: Callable[[], Awaitable[Dict[str, Any]]],
+        commands: int = 1
+    ) -> Any:
+        inline = self._explain_requested()
+        if self.threshold is None and not inline:
+            with db_call(commands):
+                return await loader()
+        start = time.perf_counter()
+        error = None
+        try:
+            with db_call(commands):
+                return await loader()
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            await self._report(
+                kind, query, sort, explainer, inline,
+                (time.perf_counter() - start) * 1000, error
+            )
+
+    async def _report(
+        self,
+        kind: str,
+        query: Any,
+        sort: Any,
+        explainer: Callable[[], Awaitable[Dict[str, Any]]],
+        inline: bool,
+        duration: float,
+        error: Optional[BaseException]
+    ):
+        slow = self.threshold is not None and (
+            duration >= self.threshold or
+            isinstance(error, ExecutionTimeout)
+        )
+        summary = None
+        #: failed queries are not explained, they would just fail again
+        if error is None and (
+            inline or (slow and random.random() < self.explain_rate)
+        ):
+            summary = summarize_explain(await explainer())
+        if inline and summary is not None:
+            self._add_plan_header(kind, summary)
+        if slow:
+            self._log(kind, query, sort, duration, summary, error)
+
+    def _add_plan_header(self, kind: str, summary: Dict[str, Any]):
+        value = f"{kind};stages={'>'.join(summary['stages'])}"
+        if response.headers.get(self.plan_header):
+            value = f'{response.headers[self.plan_header]}, {value}'
+        response.headers[self.plan_header] = value
+
+    def _log(
+        self,
+        kind: str,
+        query: Any,
+        sort: Any,
+        duration: float,
+        summary: Optional[Dict[str, Any]],
+        error: Optional[BaseException] = None
+    ):
+        msg = (
+            f'slow mongo query on {self.mod.name}.{kind} ({duration:.1f}ms): '
+            f'filter={query_shape(query)} sort={sort}'
+        )
+        if error is not None:
+            msg += f' failed={error.__class__.__name__}'
+        if summary is not None:
+            msg += f" plan={'>'.join(summary['stages'])}"
+            if summary['collscan']:
+                msg += ' [COLLSCAN]'
+            if summary['blocking_sort']:
+                msg += ' [SORT]'
+        self.mod.app.log.warning(msg)
+
+
+class Timings:
+    __slots__ = ['data']
+
+    def __init__(self):
+        self.data: Dict[str, float] = {}
+
+    def add(self, name: str, duration: float):
+        self.data[name] = self.data.get(name, 0.0) + duration
+
+    def get(self, *names: str) -> float:
+        return sum(self.data.get(name, 0.0) for name in names)
+
+    def as_header(self) -> str:
+        return ', '.join(
+            f'{name};dur={duration * 1000:.2f}'
+            for name, duration in self.data.items()
+        )
+
+
+_timings: ContextVar[Optional[Timings]] = ContextVar(
+    '_mongorest_timings', default=None
+)
+
+
+@contextmanager
+def timing(name: str):
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+@contextmanager
+def db_call(commands: int = 1):
+    track_commands(commands)
+    with timing('db'):
+        yield
+
+
+class ServerTimingPipe(Pipe):
+    def __init__(self, mod: Any, route: str):
+        self.mod = mod
+        self.route = route
+
+    def _flush(self, timings: Timings, start: float, sink: bool = True):
+        timings.data['total'] = time.perf_counter() - start
+        if sink and self.mod.timing_sink:
+            self.mod.timing_sink(self.mod, self.route, timings.data)
+
+    async def pipe_request(self, next_pipe, **kwargs):
+        timings = Timings()
+        token = _timings.set(timings)
+        start = time.perf_counter()
+        stream = None
+        try:
+            rv = await next_pipe(**kwargs)
+            #: the module service pipe runs outside the route pipeline,
+            #  so responses get encoded here to be timed
+            with timing('json'):
+                body = _json_dump(rv)
+        except HTTPStream as exc:
+            stream = exc
+            raise
+        finally:
+            _timings.reset(token)
+            self._flush(timings, start, sink=stream is None)
+            response.headers['server-timing'] = timings.as_header()
+            if stream is not None:
+                #: streamed batches can only reach the sink
+                stream.on_close(partial(self._flush, timings, start))
+        if isinstance(body, str):
+            body = body.encode('utf8')
+        response.headers['content-type'] = 'application/json'
+        raise HTTPBytes(
+            response.status,
+            body,
+            headers=response.headers,
+            cookies=response.cookies
+        )
+
+
+def _build_timed_pipe_request(method, name):
+    @wraps(method)
+    async def pipe_request(next_pipe, **kwargs):
+        timings = _timings.get()
+        if timings is None:
+            return await method(next_pipe, **kwargs)
+        inner = 0.0
+
+        async def timed_next_pipe(**kwargs):
+            nonlocal inner
+            start = time.perf_counter()
+            try:
+                return await next_pipe(**kwargs)
+            finally:
+                inner += time.perf_counter() - start
+
+        start = time.perf_counter()
+        try:
+            return await method(timed_next_pipe, **kwargs)
+        finally:
+            timings.add(name, time.perf_counter() - start - inner)
+    return pipe_request
+
+
+def time_pipe(pipe: Pipe) -> Pipe:
+    #: pipes are shared between routes, so they get wrapped just once
+    if not getattr(pipe, '_timed_', False):
+        pipe.pipe_request = _build_timed_pipe_request(
+            pipe.pipe_request, pipe.__class__.__name__
+        )
+        pipe._timed_ = True
+    return pipe
+
+
+def time_handler(f: Callable[..., Awaitable[Any]]):
+    @wraps(f)
+    async def handler(**kwargs):
+        timings = _timings.get()
+        if timings is None:
+            return await f(**kwargs)
+        nested = timings.get('db', 'serialize')
+        start = time.perf_counter()
+        try:
+            return await f(**kwargs)
+        finally:
+            timings.add(
+                'handler',
+                time.perf_counter() - start -
+                (timings.get('db', 'serialize') - nested)
+            )
+    return handler
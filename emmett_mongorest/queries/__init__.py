@@ -1 +1,5 @@
-from .helpers import JSONQueryPipe, AggregateJSONQueryPipe
+from .helpers import (
+    JSONQueryPipe,
+    AggregateJSONQueryPipe,
+    is_empty_condition
+)
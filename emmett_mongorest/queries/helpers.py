@@ -13,19 +13,48 @@ from emmett import request, response, sdict
 from emmett_rest.queries.errors import QueryError
 from emmett_rest.queries.helpers import JSONQueryPipe as _JSONQueryPipe
 
+from ..cache import LRUCache, clone_data
 from .parser import (
     OuterCollector,
-    parse_conditions as _parse_conditions,
-    parse_aggregate_conditions as _parse_aggregate_conditions
+    compile_conditions as _compile_conditions,
+    compile_aggregate_conditions as _compile_aggregate_conditions
 )
 
 
+_logical_operators = {'$and', '$or', '$nor', '$not'}
+
+
+def is_empty_condition(condition):
+    #: conditions with only logical operators over empty ones match anything
+    if not condition:
+        return True
+    if not isinstance(condition, dict) or set(condition) - _logical_operators:
+        return False
+    for value in condition.values():
+        values = value if isinstance(value, list) else [value]
+        if not all(is_empty_condition(item) for item in values):
+            return False
+    return True
+
+
 class JSONQueryPipe(_JSONQueryPipe):
+    def __init__(self, mod):
+        self.cache = LRUCache(mod.query_cache_size)
+        super().__init__(mod)
+
+    def set_accepted(self):
+        super().set_accepted()
+        self._accepted_key = frozenset(self._accepted_set)
+        self.cache.clear()
+
     def _build_query_ctx(self):
         return sdict()
 
-    def _build_query(self, query, param, ctx):
-        return _parse_conditions(query, param, self._accepted_set, **ctx)
+    def _clone_query_ctx(self, ctx):
+        return sdict()
+
+    def _compile_query(self, param, ctx):
+        return _compile_conditions(param, self._accepted_set, **ctx)
 
     def _apply_query(self, query, ctx, params):
         params['query'] = query
@@ -33,23 +62,40 @@ class JSONQueryPipe(_JSONQueryPipe):
     def _after_query(self, query, ctx, params):
         pass
 
+    def _get_compiled_query(self, param):
+        use_cache = self.cache.enabled and isinstance(param, (str, bytes))
+        if use_cache:
+            cache_key = (param, self._accepted_key)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return (
+                    clone_data(cached[0]),
+                    self._clone_query_ctx(cached[1])
+                )
+        input_condition = self._parse_where_param(param)
+        ctx = self._build_query_ctx()
+        condition = self._compile_query(input_condition, ctx)
+        if use_cache:
+            self.cache.set(
+                cache_key,
+                (clone_data(condition), self._clone_query_ctx(ctx))
+            )
+        return condition, ctx
+
     async def pipe_request(self, next_pipe, **kwargs):
         if request.query_params[self.query_param] and self._accepted_set:
             try:
-                input_condition = self._parse_where_param(
+                condition, ctx = self._get_compiled_query(
                     request.query_params[self.query_param]
                 )
-            except ValueError:
-                response.status = 400
-                return self.mod.error_400({'where': 'invalid value'})
-            ctx = self._build_query_ctx()
-            try:
-                query = self._build_query(
-                    kwargs['query'], input_condition, ctx
-                )
             except QueryError as exc:
                 response.status = 400
                 return self.mod.error_400({'where': exc.gen_msg()})
+            except ValueError:
+                response.status = 400
+                return self.mod.error_400({'where': 'invalid value'})
+            query = kwargs['query'].where(condition)
+            query.where_condition = condition
             try:
                 self._apply_query(query, ctx, kwargs)
                 self._after_query(query, ctx, kwargs)
@@ -76,9 +122,12 @@ class AggregateJSONQueryPipe(JSONQueryPipe):
     def _build_query_ctx(self):
         return sdict(outer=OuterCollector())
 
-    def _build_query(self, query, param, ctx):
-        return _parse_aggregate_conditions(
-            query, param, self._accepted_set, **ctx
+    def _clone_query_ctx(self, ctx):
+        return sdict(outer=OuterCollector(clone_data(ctx.outer.data)))
+
+    def _compile_query(self, param, ctx):
+        return _compile_aggregate_conditions(
+            param, self._accepted_set, **ctx
         )
 
     def _after_query(self, query, ctx, params):
@@ -12,16 +12,23 @@
 from __future__ import annotations
 
 from collections import defaultdict
-from contextlib import contextmanager
-from typing import Any, Callable, Dict, List, Optional, Set
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 from bson.objectid import ObjectId
-from emmett import sdict
 from emmett_rest.queries.errors import QueryError
 
 from ..helpers import MongoQuery
 from .validation import op_validators, op_validators_aggregate
 
+OpParser = Callable[
+    [str, Any, Dict[str, Any], Optional[str], Callable[[Any], Any]], Any
+]
+
+_OP_VALUE = 0
+_OP_GLUE = 1
+_OP_DICT = 2
+_OP_OUTER = 3
+
 
 class OuterCollector:
     __slots__ = ['data']
@@ -29,65 +36,13 @@ class OuterCollector:
     def __init__(self, data=None):
         self.data = data if data is not None else defaultdict(list)
 
-    @contextmanager
-    def ctx(self, field_key: str):
-        inner = self.__class__()
-        yield inner
-        for key, values in inner.data.items():
-            self.data[key].extend([(field_key, val) for val in values])
-
-
-def _glue_op_parser(
-    key: str,
-    value: Any,
-    result: Dict[str, Any],
-    ctx: sdict
-) -> List[Dict[str, Any]]:
-    if not isinstance(value, list):
-        raise QueryError(op=key, value=value)
-    return [
-        rv for rv in map(
-            lambda v: _conditions_parser(
-                ctx.op_set,
-                ctx.op_validators,
-                ctx.op_parsers,
-                ctx.op_remap,
-                ctx.op_outer,
-                v,
-                ctx.accepted_set,
-                outer=ctx.outer,
-                parent=key
-            ), value
-        ) if rv
-    ]
-
-
-def _dict_op_parser(
-    key: str,
-    value: Any,
-    result: Dict[str, Any],
-    ctx: sdict
-) -> Dict[str, Any]:
-    if not isinstance(value, dict):
-        raise QueryError(op=key, value=value)
-    return _conditions_parser(
-        ctx.op_set,
-        ctx.op_validators,
-        ctx.op_parsers,
-        ctx.op_remap,
-        ctx.op_outer,
-        value,
-        ctx.accepted_set,
-        outer=ctx.outer,
-        parent=key
-    )
-
 
 def _object_id_parser(
     key: str,
     value: Any,
     result: Dict[str, Any],
-    ctx: sdict
+    parent: Optional[str],
+    validator: Callable[[Any], Any]
 ) -> ObjectId:
     try:
         value = ObjectId(value)
@@ -100,10 +55,13 @@ def _object_id_list_parser(
     key: str,
     value: Any,
     result: Dict[str, Any],
-    ctx: sdict
+    parent: Optional[str],
+    validator: Callable[[Any], Any]
 ) -> List[ObjectId]:
+    if not isinstance(value, list):
+        raise QueryError(op=key, value=value)
     return [
-        _object_id_parser(key, element, result, ctx)
+        _object_id_parser(key, element, result, parent, validator)
         for element in value
     ]
 
@@ -112,7 +70,8 @@ def _iregex_parser(
     key: str,
     value: Any,
     result: Dict[str, Any],
-    ctx: sdict
+    parent: Optional[str],
+    validator: Callable[[Any], Any]
 ) -> Any:
     result['$options'] = 'i'
     return value
@@ -122,38 +81,35 @@ def _geonear_aggr_parser(
     key: str,
     value: Any,
     result: Dict[str, Any],
-    ctx: sdict
+    parent: Optional[str],
+    validator: Callable[[Any], Any]
 ) -> Any:
-    if ctx.parent in ['$or', '$nor']:
+    if parent in ['$or', '$nor']:
         raise QueryError(op=key, value=value)
-    return _generic_op_parser(key, value, result, ctx)
+    return _generic_op_parser(key, value, result, parent, validator)
 
 
 def _generic_op_parser(
     key: str,
     value: Any,
     result: Dict[str, Any],
-    ctx: sdict
+    parent: Optional[str],
+    validator: Callable[[Any], Any]
 ) -> Any:
-    op_validator = ctx.op_validators[key]
     try:
-        value = op_validator(value)
-    except AssertionError as e:
+        value = validator(value)
+    except AssertionError:
         raise QueryError(op=key, value=value)
     return value
 
 
-op_parsers = {key: _generic_op_parser for key in op_validators.keys()}
-op_parsers.update({
-    '$or': _glue_op_parser,
-    '$and': _glue_op_parser,
-    '$nor': _glue_op_parser,
-    '$not': _dict_op_parser,
-    '$match': _dict_op_parser,
+op_glue = {'$or', '$and', '$nor'}
+op_dict = {'$not', '$match'}
+op_parsers = {
     '$id': _object_id_parser,
     '$id.in': _object_id_list_parser,
     '$iregex': _iregex_parser
-})
+}
 op_parsers_aggregate = {key: val for key, val in op_parsers.items()}
 op_parsers_aggregate.update({
     '$geo.near': _geonear_aggr_parser
@@ -171,92 +127,143 @@ op_remap.update({
 })
 
 
-def _conditions_parser(
-    op_set: Set[str],
-    op_validators: Dict[str, Callable[[Any], Any]],
-    op_parsers: Dict[str, Callable[[str, Any, sdict], Any]],
-    op_remap: Dict[str, str],
-    op_outer: Set[str],
-    query_dict: Dict[str, Any],
-    accepted_set: Set[str],
-    outer: OuterCollector,
-    parent: Optional[str] = None
-) -> Dict[str, Any]:
-    query, ctx = {}, sdict(
-        op_set=op_set,
-        op_validators=op_validators,
-        op_parsers=op_parsers,
-        op_remap=op_remap,
-        op_outer=op_outer,
-        accepted_set=accepted_set,
-        outer=outer,
-        parent=parent
-    )
-    query_key_set = set(query_dict.keys())
-    fields_keys = defaultdict(list)
-    for key in query_key_set:
-        fields_keys[key.split(".")[0]].append((key, query_dict[key]))
-    for key in query_key_set & op_outer:
-        outer.data[op_remap[key]].append(
-            op_parsers[key](key, query_dict[key], query, ctx)
-        )
-        query_key_set.remove(key)
-    for key in query_key_set & op_set:
-        query[op_remap[key]] = op_parsers[key](
-            key, query_dict[key], query, ctx
-        )
-    for key in accepted_set & set(fields_keys.keys()):
-        for original_key, value in fields_keys[key]:
-            if isinstance(value, dict):
-                with outer.ctx(original_key) as step_outer:
-                    parsed = _conditions_parser(
-                        op_set,
-                        op_validators,
-                        op_parsers,
-                        op_remap,
-                        op_outer,
-                        value,
-                        accepted_set,
-                        outer=step_outer,
-                        parent=parent
-                    )
-                if not parsed:
-                    continue
-                query[original_key] = parsed
+class QueryCompiler:
+    __slots__ = ['handlers']
+
+    def __init__(
+        self,
+        op_validators: Dict[str, Callable[[Any], Any]],
+        op_parsers: Dict[str, OpParser],
+        op_remap: Dict[str, str],
+        op_outer: Optional[Set[str]] = None
+    ):
+        op_outer = op_outer or set()
+        self.handlers: Dict[
+            str, Tuple[int, str, OpParser, Callable[[Any], Any]]
+        ] = {}
+        for key, validator in op_validators.items():
+            if key in op_outer:
+                kind = _OP_OUTER
+            elif key in op_glue:
+                kind = _OP_GLUE
+            elif key in op_dict:
+                kind = _OP_DICT
             else:
-                query[original_key] = value
-    return query
+                kind = _OP_VALUE
+            self.handlers[key] = (
+                kind,
+                op_remap[key],
+                op_parsers.get(key, _generic_op_parser),
+                validator
+            )
+
+    def __call__(
+        self,
+        query_dict: Dict[str, Any],
+        accepted_set: Set[str],
+        outer: Optional[OuterCollector] = None
+    ) -> Dict[str, Any]:
+        outer = outer or OuterCollector()
+        handlers = self.handlers
+        rv = {}
+        #: nodes are (query_dict, result, parent, fields_path) tuples,
+        #  while finalizers are plain callables run in post-order
+        stack = [(query_dict, rv, None, ())]
+        while stack:
+            node = stack.pop()
+            if callable(node):
+                node()
+                continue
+            node_dict, result, parent, path = node
+            if not isinstance(node_dict, dict):
+                raise QueryError(op=parent, value=node_dict)
+            op_tasks, field_tasks = [], []
+            for key, value in node_dict.items():
+                handler = handlers.get(key)
+                if handler is None:
+                    if key.split('.', 1)[0] not in accepted_set:
+                        continue
+                    if not isinstance(value, dict):
+                        result[key] = value
+                        continue
+                    result[key] = child = {}
+                    field_tasks.append((value, child, parent, path + (key,)))
+                    field_tasks.append(_build_field_finalizer(result, key))
+                    continue
+                kind, target, parser, validator = handler
+                if kind == _OP_VALUE:
+                    result[target] = parser(
+                        key, value, result, parent, validator
+                    )
+                elif kind == _OP_GLUE:
+                    if not isinstance(value, list):
+                        raise QueryError(op=key, value=value)
+                    result[target] = children = []
+                    for element in value:
+                        children.append({})
+                        op_tasks.append((element, children[-1], key, path))
+                    op_tasks.append(_build_glue_finalizer(children))
+                elif kind == _OP_DICT:
+                    if not isinstance(value, dict):
+                        raise QueryError(op=key, value=value)
+                    result[target] = child = {}
+                    op_tasks.append((value, child, key, path))
+                else:
+                    value = parser(key, value, result, parent, validator)
+                    for field_key in reversed(path):
+                        value = (field_key, value)
+                    outer.data[target].append(value)
+            stack.extend(reversed(op_tasks + field_tasks))
+        return rv
+
+
+def _build_field_finalizer(
+    result: Dict[str, Any],
+    key: str
+) -> Callable[[], None]:
+    def finalize():
+        if not result[key]:
+            del result[key]
+    return finalize
 
 
-def _build_scoped_conditions_parser(
+def _build_glue_finalizer(
+    children: List[Dict[str, Any]]
+) -> Callable[[], None]:
+    def finalize():
+        children[:] = [child for child in children if child]
+    return finalize
+
+
+def _build_scoped_conditions_compiler(
     op_validators: Dict[str, Callable[[Any], Any]],
-    op_parsers: Dict[str, Callable[[str, Any, sdict], Any]],
+    op_parsers: Dict[str, OpParser],
     op_remap: Dict[str, str],
     op_outer: Optional[Set[str]] = None
-) -> Callable[[MongoQuery, Dict[str, Any], Set[str]], MongoQuery]:
-    op_set = set(op_validators.keys())
-    op_outer = op_outer or set()
+) -> QueryCompiler:
+    return QueryCompiler(op_validators, op_parsers, op_remap, op_outer)
 
+
+def _build_scoped_conditions_parser(
+    compiler: QueryCompiler
+) -> Callable[[MongoQuery, Dict[str, Any], Set[str]], MongoQuery]:
     def scoped(
         query: MongoQuery,
         query_dict: Dict[str, Any],
         accepted_set: Set[str],
         outer: Optional[OuterCollector] = None
     ) -> MongoQuery:
-        outer = outer or OuterCollector()
-        return query.where(
-            _conditions_parser(
-                op_set, op_validators, op_parsers, op_remap, op_outer,
-                query_dict, accepted_set,
-                outer=outer
-            )
-        )
+        return query.where(compiler(query_dict, accepted_set, outer=outer))
     return scoped
 
 
-parse_conditions = _build_scoped_conditions_parser(
+compile_conditions = _build_scoped_conditions_compiler(
     op_validators, op_parsers, op_remap
 )
-parse_aggregate_conditions = _build_scoped_conditions_parser(
+compile_aggregate_conditions = _build_scoped_conditions_compiler(
     op_validators_aggregate, op_parsers_aggregate, op_remap, {'$geo.near'}
 )
+parse_conditions = _build_scoped_conditions_parser(compile_conditions)
+parse_aggregate_conditions = _build_scoped_conditions_parser(
+    compile_aggregate_conditions
+)
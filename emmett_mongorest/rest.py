@@ -11,31 +11,96 @@
 
 from __future__ import annotations
 
-import copy
+import asyncio
 
 from typing import Any, Awaitable, Callable, Dict, List, Optional, Union, Type
 
+import bson
+
 from emmett import AppModule, request, response, sdict
 from emmett.extensions import Extension
+from emmett.parsers import Parsers
 from emmett.pipeline import Pipe
+from emmett.serializers import Serializers
 from emmett_mongo.db import Collection
 from emmett_rest.rest import RESTModule as _RESTModule
 from emmett_rest.typing import ParserType, SerializerType
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
 from pydantic import BaseModel, ValidationError
-from pymongo.errors import OperationFailure, DuplicateKeyError
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import (
+    BulkWriteError,
+    DuplicateKeyError,
+    ExecutionTimeout,
+    OperationFailure
+)
 
 from .helpers import (
+    ETagPipe,
     MongoQuery,
+    QueryTimeoutPipe,
     SetFetcher,
     RecordQueryBuilder,
     RecordFetcher,
     FieldPipe,
-    FieldsPipe
+    FieldsPipe,
+    ProjectionPipe,
+    build_etag,
+    build_projection,
+    build_update_diff
+)
+from .cache import (
+    MemoryCacheBackend,
+    ResultCache,
+    SingleFlight,
+    freeze_data
+)
+from .formats import FormatPipe, build_formats, negotiate
+from .http import HTTPStream
+from .indexes import IndexAdvisor
+from .limits import LimiterPipe, build_limits, routes_kinds
+from .metrics import MetricsPipe, track_documents
+from .pagination import (
+    build_cursors,
+    decode_cursor,
+    invert_sort,
+    keyset_condition,
+    keyset_sort
+)
+from .profiling import (
+    ServerTimingPipe,
+    SlowQueryLog,
+    db_call,
+    time_handler,
+    time_pipe,
+    timing
 )
-from .queries import JSONQueryPipe, AggregateJSONQueryPipe
+from .queries import (
+    JSONQueryPipe,
+    AggregateJSONQueryPipe,
+    is_empty_condition
+)
+from .serializers import serialize as _serialize
+
+
+_json_dump = Serializers.get_for('json')
+_json_load = Parsers.get_for('json')
+
+#: BadValue, FailedToParse and TypeMismatch
+_client_error_codes = {2, 9, 14}
 
 
 class MongoRESTModule(_RESTModule):
+    _all_methods = _RESTModule._all_methods | {
+        'export', 'bulk_create', 'bulk_update', 'bulk_delete'
+    }
+    _export_formats = {
+        'ndjson': 'application/x-ndjson',
+        'json': 'application/json'
+    }
+    _formatted_routes = {'index', 'read', 'group', 'stats'}
+
     @classmethod
     def from_app(
         cls,
@@ -130,6 +195,48 @@ class MongoRESTModule(_RESTModule):
         pipeline: List[Pipe] = []
     ):
         self.collection = collection
+        self.pagination_mode = ext.config.pagination_mode
+        self._cursor_param = ext.config.cursor_param
+        self.count_mode = ext.config.count_mode
+        self.count_cap = ext.config.count_cap
+        self.index_query_mode = ext.config.index_query_mode
+        self.use_projection = ext.config.use_projection
+        self.query_cache_size = ext.config.query_cache_size
+        self.export_batch_size = ext.config.export_batch_size
+        self.export_format = ext.config.export_format
+        self.bulk_max_size = ext.config.bulk_max_size
+        self.refetch_on_create = ext.config.refetch_on_create
+        self.atomic_delete = ext.config.atomic_delete
+        self.use_etag = ext.config.use_etag
+        self.etag_field = ext.config.etag_field
+        self.aggregation_cache = ResultCache(
+            (ext.config.aggregation_cache_backend or MemoryCacheBackend)(
+                ext.config.aggregation_cache_size
+            ),
+            ext.config.aggregation_cache_ttl
+        )
+        self.coalesce_reads = ext.config.coalesce_reads
+        self.slow_query_log = SlowQueryLog(
+            self,
+            ext.config.slow_query_threshold,
+            ext.config.slow_query_explain_rate,
+            ext.config.explain_header
+        )
+        self.server_timing = ext.config.server_timing
+        self.timing_sink = ext.config.timing_sink
+        self.use_metrics = ext.config.use_metrics
+        self.max_time_ms = ext.config.max_time_ms
+        self.max_time_ms_routes = dict(ext.config.max_time_ms_routes or {})
+        self.error_500 = self.build_error_500
+        self.error_503 = self.build_error_503
+        self.concurrency_limits = build_limits(
+            ext.config.concurrency_limits, ext.config.concurrency_queue_size
+        )
+        self.concurrency_retry_after = ext.config.concurrency_retry_after
+        self.concurrency_reject_status = ext.config.concurrency_reject_status
+        self._reads_flight = SingleFlight()
+        self.response_formats = list(ext.config.response_formats or [])
+        self._accepted_formats = build_formats(self.response_formats)
         super().__init__(
             ext, name, import_name, model, serializer, parser,
             enabled_methods, disabled_methods,
@@ -150,11 +257,27 @@ class MongoRESTModule(_RESTModule):
             RecordQueryBuilder(self),
             RecordFetcher(self)
         ]
-        self.index_pipeline = [SetFetcher(self), self._json_query_pipe]
+        self._projection_pipe = ProjectionPipe(self)
+        self.index_pipeline = [
+            SetFetcher(self),
+            self._projection_pipe,
+            self._json_query_pipe,
+            ETagPipe(self)
+        ]
         self.create_pipeline = []
-        self.read_pipeline = list(self._obj_pipeline)
+        self.read_pipeline = [
+            SetFetcher(self),
+            self._projection_pipe,
+            RecordQueryBuilder(self),
+            ETagPipe(self, record=True),
+            RecordFetcher(self, coalesce=True)
+        ]
         self.update_pipeline = list(self._obj_pipeline)
-        self.delete_pipeline = list(self._obj_pipeline)
+        #: atomic deletes skip the fetcher and go with find_one_and_delete
+        self.delete_pipeline = (
+            [SetFetcher(self), RecordQueryBuilder(self)]
+            if self.atomic_delete else list(self._obj_pipeline)
+        )
         self.group_pipeline = [
             self._group_field_pipe,
             SetFetcher(self),
@@ -165,14 +288,128 @@ class MongoRESTModule(_RESTModule):
             SetFetcher(self),
             self._json_aggr_query_pipe
         ]
-        self.sample_pipeline = [SetFetcher(self), self._json_aggr_query_pipe]
+        self.sample_pipeline = [
+            SetFetcher(self),
+            self._projection_pipe,
+            self._json_aggr_query_pipe
+        ]
+        self.export_pipeline = [
+            SetFetcher(self),
+            self._projection_pipe,
+            self._json_query_pipe
+        ]
+        self.bulk_create_pipeline = []
+        self.bulk_update_pipeline = [SetFetcher(self), self._json_query_pipe]
+        self.bulk_delete_pipeline = [SetFetcher(self), self._json_query_pipe]
+
+    def _expose_routes(self):
+        path_base_trail = (
+            self._path_base.endswith('/') and self._path_base or
+            f'{self._path_base}/'
+        )
+        self._methods_map = {
+            'index': (self._path_base, 'get'),
+            'read': (self._path_rid, 'get'),
+            'create': (self._path_base, 'post'),
+            'update': (self._path_rid, ['put', 'patch']),
+            'delete': (self._path_rid, 'delete'),
+            'group': (f'{path_base_trail}group/<str:field>', 'get'),
+            'stats': (f'{path_base_trail}stats', 'get'),
+            'sample': (f'{path_base_trail}sample', 'get'),
+            'export': (f'{path_base_trail}export', 'get'),
+            'bulk_create': (f'{path_base_trail}bulk', 'post'),
+            'bulk_update': (f'{path_base_trail}bulk', 'patch'),
+            'bulk_delete': (f'{path_base_trail}bulk', 'delete')
+        }
+        for key in self.enabled_methods:
+            path, methods = self._methods_map[key]
+            pipeline = getattr(self, key + "_pipeline")
+            f = getattr(self, "_" + key)
+            if self.server_timing:
+                pipeline = [time_pipe(pipe) for pipe in pipeline]
+                f = time_handler(f)
+            pipeline = [QueryTimeoutPipe(self, key)] + pipeline
+            if key in routes_kinds:
+                pipeline = [LimiterPipe(self, key)] + pipeline
+            if self.response_formats and key in self._formatted_routes:
+                pipeline = [
+                    FormatPipe(self, self._accepted_formats)
+                ] + pipeline
+            if self.server_timing:
+                #: outside of formats, so the timing pipe only encodes json
+                pipeline = [ServerTimingPipe(self, key)] + pipeline
+            if self.use_metrics:
+                pipeline = [MetricsPipe(self, key)] + pipeline
+            self.route(path, pipeline=pipeline, methods=methods, name=key)(f)
+
+    def set_concurrency_limits(
+        self,
+        limits: Dict[str, int],
+        queue_size: Optional[int] = None
+    ):
+        self.concurrency_limits = build_limits(
+            limits,
+            self.ext.config.concurrency_queue_size if queue_size is None
+            else queue_size
+        )
+
+    def _route_limits(self, route):
+        kind = routes_kinds.get(route)
+        return [
+            limit for limit in (
+                self.concurrency_limits.get(kind),
+                self.ext.limits.get(kind)
+            ) if limit
+        ]
 
+    @property
+    def concurrency_info(self) -> Dict[str, Dict[str, int]]:
+        return {
+            kind: limit.info()
+            for kind, limit in self.concurrency_limits.items()
+        }
 
     def _get_dbset(self):
         return MongoQuery()
 
+    async def coalesce(self, key, loader):
+        if not self.coalesce_reads:
+            return await loader()
+        return await self._reads_flight.do(key, loader)
+
     async def _get_row(self, query):
-        return await self.collection.find_one(query.result)
+        query_filter, projection = query.result, query.projection
+
+        def loader():
+            return self.slow_query_log.observe(
+                'read', query_filter, None,
+                lambda: self.collection.find_one(
+                    query_filter, projection=projection,
+                    **self._max_time_kwargs('read', 'max_time_ms')
+                ),
+                lambda: self.collection.find(
+                    query_filter, projection=projection
+                ).limit(1).explain()
+            )
+
+        if not query.coalesce:
+            return await loader()
+        return await self.coalesce(
+            ('row', freeze_data(query_filter), freeze_data(projection)),
+            loader
+        )
+
+    def get_projection(self, fields=None):
+        if not self.use_projection:
+            return None
+        if fields is None:
+            rv = self.serializer._projection_
+        else:
+            rv = self.serializer._build_projection(set(fields))
+        if self.use_etag and self.etag_field:
+            #: version based tags are built from the fetched row
+            rv = build_projection(list(rv) + [self.etag_field])
+        return rv
 
     @staticmethod
     def get_cursor_pagination(pagination):
@@ -198,28 +435,137 @@ class MongoRESTModule(_RESTModule):
             rv.append((field, direction))
         return rv
 
+    def get_response_format(self):
+        if not self.response_formats:
+            return None
+        return negotiate(request.headers.get('accept'), self._accepted_formats)
+
+    def build_record_etag(self, row):
+        #: documents without a version fall back to the payload hash
+        if self.etag_field not in row:
+            return None
+        return build_etag([
+            str(row['_id']),
+            row[self.etag_field],
+            request.query_params.fields or ''
+        ])
+
+    async def get_record_etag(self, query):
+        with db_call():
+            row = await self.collection.find_one(
+                query.result, projection={self.etag_field: 1}
+            )
+        if not row:
+            return None
+        return self.build_record_etag(row)
+
+    def get_keyset_cursor(self, sort):
+        token = request.query_params[self._cursor_param]
+        if not token or not isinstance(token, str):
+            return None
+        return decode_cursor(sort, token)
+
+    async def _load_bulk_body(self):
+        try:
+            return _json_load(await request.body)
+        except Exception:
+            return None
+
+    def _get_bulk_items(self, body):
+        if isinstance(body, dict):
+            body = body.get(self.list_envelope)
+        if not isinstance(body, list):
+            return None
+        return body
+
+    def _parse_item_params(self, params):
+        #: bulk items are plain attributes, even with parsing envelopes
+        if self.parser.envelope:
+            params = {self.parser.envelope: params}
+        rv = self.parser.__parse_params__(params)
+        for callback in self._after_params_callbacks:
+            callback(rv)
+        return rv
+
+    async def parse_bulk_params(self):
+        items = self._get_bulk_items(await self._load_bulk_body())
+        if (
+            items is None or
+            not all(isinstance(item, dict) for item in items)
+        ):
+            return None
+        return [self._parse_item_params(item) for item in items]
+
+    def _has_where_param(self):
+        return bool(
+            request.query_params[self._json_query_pipe.query_param] and
+            self._json_query_pipe._accepted_set
+        )
+
+    def _check_where_condition(self, query):
+        #: an empty condition would match the whole collection
+        if is_empty_condition(query.where_condition):
+            response.status = 400
+            return self.error_400({'where': 'invalid value'})
+        return None
+
+    @staticmethod
+    def _parse_bulk_id(value):
+        try:
+            return ObjectId(value)
+        except (TypeError, InvalidId):
+            return None
+
     def build_error_422(self, errors=None):
         if errors:
             return {'errors': errors}
         return {'errors': {'request': 'unprocessable entity'}}
 
-    def _build_meta(self, count, pagination):
+    def build_error_500(self, errors=None):
+        if errors:
+            return {'errors': errors}
+        return {'errors': {'request': 'internal error'}}
+
+    def build_error_503(self, errors=None):
+        if errors:
+            return {'errors': errors}
+        return {'errors': {'request': 'service unavailable'}}
+
+    def _query_failure(self, exc):
+        #: malformed filters are on the client, anything else on the server
+        if exc.code in _client_error_codes:
+            response.status = 400
+            return self.error_400({'where': 'invalid value'})
+        response.status = 500
+        return self.error_500({'query': 'execution failed'})
+
+    def _build_meta(self, count, pagination, **extras):
         page, page_size = pagination
         return {
             'object': 'list',
-            'has_more': count > (page * page_size),
-            'total_objects': count
+            'has_more': count is not None and count > (page * page_size),
+            'total_objects': count,
+            **extras
         }
 
-    def serialize_with_list_envelope(self, data, pagination, **extras):
+    def serialize(self, data, **extras):
+        track_documents(len(data) if isinstance(data, list) else 1)
+        with timing('serialize'):
+            return _serialize(data, self.serializer, **extras)
+
+    def serialize_with_list_envelope(
+        self, data, pagination, count=None, meta_extras=None, **extras
+    ):
         return {self.list_envelope: self.serialize(data, **extras)}
 
     def serialize_with_list_envelope_and_meta(
-        self, data, pagination, count, **extras
+        self, data, pagination, count, meta_extras=None, **extras
     ):
         return {
             self.list_envelope: self.serialize(data, **extras),
-            self.meta_envelope: self.build_meta(count, pagination)
+            self.meta_envelope: self.build_meta(
+                count, pagination, **(meta_extras or {})
+            )
         }
 
     def pack_with_list_envelope_and_meta(self, envelope, data, **extras):
@@ -254,9 +600,7 @@ class MongoRESTModule(_RESTModule):
         try:
             for callback in self._before_update_callbacks:
                 await callback(row, attrs)
-            _row = copy.deepcopy(row)
-            _row.update(attrs)
-            obj = self.model(**_row)
+            obj = self.model(**{**row, **attrs})
             # await self._after_validate_update(obj, row)
         except ValidationError as exc:
             self._reparse_validation_errors(errors, exc)
@@ -264,17 +608,202 @@ class MongoRESTModule(_RESTModule):
         #     errors = {exc.field: exc.validation_message}
         return obj, errors
 
-    async def _index(self, query):
+    def get_max_time_ms(self, route):
+        return self.max_time_ms_routes.get(route, self.max_time_ms)
+
+    def _max_time_kwargs(self, route, key='maxTimeMS'):
+        max_time_ms = self.get_max_time_ms(route)
+        return {key: max_time_ms} if max_time_ms else {}
+
+    async def count_objects(self, query_filter, route='index'):
+        mode = self.count_mode
+        if mode == 'none':
+            return None, mode
+        if mode == 'estimated':
+            if not query_filter:
+                return await self.collection.estimated_document_count(
+                    **self._max_time_kwargs(route)
+                ), mode
+            mode = 'exact'
+        if mode == 'capped':
+            return await self.collection.count_documents(
+                query_filter, limit=self.count_cap,
+                **self._max_time_kwargs(route)
+            ), mode
+        return await self.collection.find(
+            query_filter, **self._max_time_kwargs(route, 'max_time_ms')
+        ).count(), mode
+
+    async def _fetch_page(
+        self, count_filter, rows_filter, sort, skip, limit, projection=None
+    ):
+        return await self.coalesce(
+            (
+                'page', self.index_query_mode, self.count_mode,
+                freeze_data(
+                    (count_filter, rows_filter, sort, skip, limit, projection)
+                )
+            ),
+            lambda: self.slow_query_log.observe(
+                'index', rows_filter, sort,
+                lambda: self._load_page(
+                    count_filter, rows_filter, sort, skip, limit, projection
+                ),
+                lambda: self.collection.find(
+                    rows_filter, projection=projection, sort=sort
+                ).skip(skip).limit(limit).explain(),
+                commands=(
+                    1 if self._uses_facet(count_filter, rows_filter) or
+                    self.count_mode == 'none' else 2
+                )
+            )
+        )
+
+    def _uses_facet(self, count_filter, rows_filter):
+        #: keyset conditions can't be applied ahead of the count in a
+        #  $facet, so those pages go with concurrent queries instead
+        return (
+            self.index_query_mode == 'facet' and rows_filter == count_filter
+        )
+
+    async def _load_page(
+        self, count_filter, rows_filter, sort, skip, limit, projection=None
+    ):
+        if self._uses_facet(count_filter, rows_filter):
+            return await self._fetch_page_facet(
+                count_filter, sort, skip, limit, projection
+            )
+        cursor = self.collection.find(
+            rows_filter, projection=projection, sort=sort,
+            **self._max_time_kwargs('index', 'max_time_ms')
+        )
+        if skip:
+            cursor = cursor.skip(skip)
+        cursor = cursor.limit(limit)
+        if self.index_query_mode != 'sequential':
+            (count, count_mode), rows = await asyncio.gather(
+                self.count_objects(count_filter),
+                cursor.to_list(length=None)
+            )
+        else:
+            count, count_mode = await self.count_objects(count_filter)
+            rows = await cursor.to_list(length=None)
+        return rows, count, count_mode
+
+    async def _fetch_page_facet(
+        self, query_filter, sort, skip, limit, projection=None
+    ):
+        match_steps = [{'$match': query_filter}] if query_filter else []
+        #: sorts inside $facet can't use indexes, but a $sort followed by
+        #  $limit only keeps the top rows in memory, so large sets can't
+        #  hit the blocking sort limit
+        rows_steps = []
+        if sort:
+            rows_steps.append({'$sort': {key: val for key, val in sort}})
+        rows_steps.append({'$limit': skip + limit})
+        if skip:
+            rows_steps.append({'$skip': skip})
+        if projection:
+            rows_steps.append({'$project': projection})
+        facets = {'rows': rows_steps}
+        #: metadata is not reachable from a pipeline, so estimates are exact
+        count_mode = 'exact' if self.count_mode == 'estimated' else \
+            self.count_mode
+        if count_mode == 'exact':
+            facets['total'] = [{'$count': 'count'}]
+        elif count_mode == 'capped':
+            facets['total'] = [
+                {'$limit': self.count_cap},
+                {'$count': 'count'}
+            ]
+        res = (await self.collection.aggregate(
+            match_steps + [{'$facet': facets}],
+            **self._max_time_kwargs('index')
+        ).to_list(length=None))[0]
+        count = None
+        if 'total' in facets:
+            count = res['total'][0]['count'] if res['total'] else 0
+        return res['rows'], count, count_mode
+
+    async def _index(self, query, fields=None):
         pagination = self.get_pagination()
+        if self.pagination_mode == 'keyset':
+            return await self._index_keyset(query, pagination, fields)
         skip, limit = self.get_cursor_pagination(pagination)
         sort = self.get_sort()
-        cursor = self.collection.find(query.result, sort=sort)
+        #: without an exact count we look ahead one row to compute has_more
+        probe = self.count_mode in ('capped', 'none')
+        query_filter = query.result
         try:
-            count = await cursor.count()
-            rows = await cursor.skip(skip).limit(limit).to_list(length=None)
-        except OperationFailure:
-            pass
-        return self.serialize_many(rows, pagination, count=count)
+            rows, count, count_mode = await self._fetch_page(
+                query_filter, query_filter, sort, skip,
+                limit + 1 if probe else limit,
+                query.projection
+            )
+        except ExecutionTimeout:
+            raise
+        except OperationFailure as exc:
+            return self._query_failure(exc)
+        meta_extras = {}
+        if probe:
+            meta_extras['has_more'] = len(rows) > limit
+            rows = rows[:limit]
+        if count_mode != 'exact':
+            meta_extras['count_mode'] = count_mode
+        return self.serialize_many(
+            rows, pagination, count=count, meta_extras=meta_extras,
+            fields=fields
+        )
+
+    async def _index_keyset(self, query, pagination, fields=None):
+        _, page_size = pagination
+        sort = keyset_sort(self.get_sort())
+        try:
+            cursor_data = self.get_keyset_cursor(sort)
+        except ValueError:
+            response.status = 400
+            return self.error_400({self._cursor_param: 'invalid value'})
+        count_filter = query.result
+        projection = query.projection
+        if projection:
+            #: cursors are built from the sort values of boundary rows
+            projection = build_projection(
+                list(projection) + [field for field, _ in sort]
+            )
+        backwards = bool(cursor_data) and cursor_data['direction'] == 'prev'
+        if cursor_data:
+            query.where(
+                keyset_condition(sort, cursor_data['values'], backwards)
+            )
+        try:
+            rows, count, count_mode = await self._fetch_page(
+                count_filter, query.result,
+                invert_sort(sort) if backwards else sort,
+                0, page_size + 1, projection
+            )
+        except ExecutionTimeout:
+            raise
+        except OperationFailure as exc:
+            return self._query_failure(exc)
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if backwards:
+            rows.reverse()
+        cursors = build_cursors(sort, rows, has_more, cursor_data)
+        meta_extras = {'has_more': cursors['next'] is not None, **cursors}
+        if count_mode != 'exact':
+            meta_extras['count_mode'] = count_mode
+        return self.serialize_many(
+            rows, pagination, count=count, meta_extras=meta_extras,
+            fields=fields
+        )
+
+    async def _read(self, row, fields=None):
+        if self.use_etag and self.etag_field:
+            etag = self.build_record_etag(row)
+            if etag:
+                response.headers['etag'] = etag
+        return self.serialize_one(row, fields=fields)
 
     async def _create(self):
         response.status = 201
@@ -283,46 +812,325 @@ class MongoRESTModule(_RESTModule):
         if errors:
             response.status = 422
             return self.error_422(errors=errors)
+        row_new = obj.dict()
         try:
-            res = await self.collection.insert_one(obj.dict())
+            with db_call():
+                res = await self.collection.insert_one(row_new)
         except DuplicateKeyError:
             response.status = 422
             return self.error_422(errors={'record': 'duplicated'})
-        row_new = await self.collection.find_one({'_id': res.inserted_id})
+        #: re-read only when server-side changes to the document matter
+        if self.refetch_on_create:
+            with db_call():
+                row_new = await self.collection.find_one(
+                    {'_id': res.inserted_id}
+                )
+        else:
+            row_new['_id'] = res.inserted_id
+            #: match what mongo stores (millisecond datetimes, naive UTC),
+            #  so callbacks get the same row with or without refetch
+            row_new = bson.decode(bson.encode(row_new))
+        await self.aggregation_cache.invalidate()
         for callback in self._after_create_callbacks:
             await callback(row_new)
         return self.serialize_one(row_new)
 
+    @staticmethod
+    def _map_bulk_write_errors(exc):
+        rv = {}
+        for error in exc.details.get('writeErrors', []):
+            if error.get('code') == 11000:
+                rv[error['index']] = {'record': 'duplicated'}
+            else:
+                rv[error['index']] = {'record': error.get('errmsg')}
+        return rv
+
+    def _build_bulk_response(self, results, success_status, **meta):
+        succeeded = sum(1 for result in results if 'errors' not in result)
+        if succeeded == len(results):
+            response.status = success_status
+        elif not succeeded:
+            response.status = 422
+        else:
+            response.status = 207
+        rv = {self.list_envelope: results}
+        if self.serialize_meta:
+            rv[self.meta_envelope] = self.build_meta(
+                len(results), (1, len(results)),
+                succeeded=succeeded,
+                failed=len(results) - succeeded,
+                **meta
+            )
+        return rv
+
+    async def _bulk_create(self):
+        items = await self.parse_bulk_params()
+        if items is None:
+            response.status = 400
+            return self.error_400({self.list_envelope: 'invalid value'})
+        if len(items) > self.bulk_max_size:
+            response.status = 400
+            return self.error_400({self.list_envelope: 'too many items'})
+        results, valid = [None] * len(items), []
+        for idx, attrs in enumerate(items):
+            obj, errors = await self.validate_creation(attrs)
+            if errors:
+                results[idx] = {'index': idx, 'errors': errors}
+                continue
+            valid.append((idx, obj.dict()))
+        write_errors = {}
+        if valid:
+            try:
+                #: pymongo sets the `_id` key on inserted documents in place
+                with db_call():
+                    await self.collection.insert_many(
+                        [doc for _, doc in valid], ordered=False
+                    )
+            except BulkWriteError as exc:
+                write_errors = self._map_bulk_write_errors(exc)
+            await self.aggregation_cache.invalidate()
+        rows = []
+        for pos, (idx, doc) in enumerate(valid):
+            if pos in write_errors:
+                results[idx] = {'index': idx, 'errors': write_errors[pos]}
+                continue
+            rows.append(doc)
+            results[idx] = {'index': idx, 'data': self.serialize(doc)}
+        for row in rows:
+            for callback in self._after_create_callbacks:
+                await callback(row)
+        return self._build_bulk_response(results, 201)
+
+    async def _bulk_update(self, query):
+        body = await self._load_bulk_body()
+        items = self._get_bulk_items(body)
+        entries, results = [], []
+        if items is not None:
+            if len(items) > self.bulk_max_size:
+                response.status = 400
+                return self.error_400({self.list_envelope: 'too many items'})
+            results = [None] * len(items)
+            for idx, item in enumerate(items):
+                if (
+                    not isinstance(item, dict) or
+                    not isinstance(item.get('attrs'), dict)
+                ):
+                    results[idx] = {
+                        'index': idx, 'errors': {'request': 'invalid value'}
+                    }
+                    continue
+                rid = self._parse_bulk_id(item.get('id'))
+                if rid is None:
+                    results[idx] = {
+                        'index': idx, 'errors': {'id': 'invalid value'}
+                    }
+                    continue
+                entries.append(
+                    (idx, rid, self._parse_item_params(item['attrs']))
+                )
+            query.where({'_id': {'$in': [rid for _, rid, _ in entries]}})
+            with db_call():
+                rows = await self.collection.find(query.result).to_list(
+                    length=None
+                )
+        elif isinstance(body, dict) and self._has_where_param():
+            error = self._check_where_condition(query)
+            if error:
+                return error
+            with db_call():
+                rows = await self.collection.find(query.result).limit(
+                    self.bulk_max_size + 1
+                ).to_list(length=None)
+            if len(rows) > self.bulk_max_size:
+                response.status = 400
+                return self.error_400({'where': 'too many records'})
+            results = [None] * len(rows)
+            for idx, row in enumerate(rows):
+                entries.append(
+                    (idx, row['_id'], self._parse_item_params(body))
+                )
+        else:
+            response.status = 400
+            return self.error_400({self.list_envelope: 'invalid value'})
+        rows_map = {row['_id']: row for row in rows}
+        ops, updates = [], []
+        for idx, rid, attrs in entries:
+            row = rows_map.get(rid)
+            if not row:
+                results[idx] = {
+                    'index': idx, 'id': str(rid),
+                    'errors': {'id': 'record not found'}
+                }
+                continue
+            obj, errors = await self.validate_update(row, attrs)
+            if errors:
+                results[idx] = {'index': idx, 'id': str(rid), 'errors': errors}
+                continue
+            data = obj.dict()
+            changes = build_update_diff(row, data)
+            op_pos = None
+            if changes:
+                op_pos = len(ops)
+                ops.append(UpdateOne({'_id': rid}, changes))
+            updates.append((idx, row, {**row, **data}, op_pos))
+        matched, modified, write_errors = 0, 0, {}
+        if ops:
+            try:
+                with db_call():
+                    res = await self.collection.bulk_write(ops, ordered=False)
+                matched, modified = res.matched_count, res.modified_count
+            except BulkWriteError as exc:
+                matched = exc.details.get('nMatched', 0)
+                modified = exc.details.get('nModified', 0)
+                write_errors = self._map_bulk_write_errors(exc)
+            await self.aggregation_cache.invalidate()
+        for idx, row, row_new, op_pos in updates:
+            if op_pos in write_errors:
+                results[idx] = {
+                    'index': idx, 'id': str(row['_id']),
+                    'errors': write_errors[op_pos]
+                }
+                continue
+            results[idx] = {
+                'index': idx, 'id': str(row['_id']),
+                'data': self.serialize(row_new)
+            }
+            for callback in self._after_update_callbacks:
+                await callback(row, row_new)
+        return self._build_bulk_response(
+            results, 200, matched=matched, modified=modified
+        )
+
+    async def _bulk_delete(self, query):
+        items = self._get_bulk_items(await self._load_bulk_body())
+        results = []
+        if items is not None:
+            if len(items) > self.bulk_max_size:
+                response.status = 400
+                return self.error_400({self.list_envelope: 'too many items'})
+            rids = [self._parse_bulk_id(item) for item in items]
+            query.where({'_id': {'$in': [rid for rid in rids if rid]}})
+            with db_call():
+                rows = await self.collection.find(query.result).to_list(
+                    length=None
+                )
+            found = {row['_id'] for row in rows}
+            for idx, rid in enumerate(rids):
+                if rid is None:
+                    errors = {'id': 'invalid value'}
+                elif rid not in found:
+                    errors = {'id': 'record not found'}
+                else:
+                    results.append({'index': idx, 'id': str(rid)})
+                    continue
+                results.append({'index': idx, 'errors': errors})
+        elif self._has_where_param():
+            error = self._check_where_condition(query)
+            if error:
+                return error
+            #: full rows are only needed to feed after_delete callbacks
+            with db_call():
+                rows = await self.collection.find(
+                    query.result,
+                    projection=(
+                        None if self._after_delete_callbacks else ['_id']
+                    )
+                ).limit(self.bulk_max_size + 1).to_list(length=None)
+            if len(rows) > self.bulk_max_size:
+                response.status = 400
+                return self.error_400({'where': 'too many records'})
+        else:
+            response.status = 400
+            return self.error_400({self.list_envelope: 'invalid value'})
+        deleted = 0
+        if rows:
+            with db_call():
+                res = await self.collection.delete_many(
+                    {'_id': {'$in': [row['_id'] for row in rows]}}
+                )
+            deleted = res.deleted_count
+        if deleted:
+            await self.aggregation_cache.invalidate()
+        for row in rows:
+            for callback in self._after_delete_callbacks:
+                await callback(row)
+        return self._build_bulk_response(
+            results, 200, matched=len(rows), deleted=deleted
+        )
+
     async def _update(self, row):
         attrs = await self.parse_params()
         obj, errors = await self.validate_update(row, attrs)
         if errors:
             response.status = 422
             return self.error_422(errors=errors)
+        changes = build_update_diff(row, obj.dict())
+        if not changes:
+            for callback in self._after_update_callbacks:
+                await callback(row, row)
+            return self.serialize_one(row)
         try:
-            row_new = await self.collection.find_one_and_update(
-                {'_id': row['_id']},
-                {'$set': obj.dict()}
-            )
+            with db_call():
+                row_new = await self.collection.find_one_and_update(
+                    {'_id': row['_id']},
+                    changes,
+                    return_document=ReturnDocument.AFTER
+                )
         except DuplicateKeyError:
             response.status = 422
             return self.error_422(errors={'record': 'duplicated'})
         if not row_new:
             response.status = 404
             return self.error_404()
+        await self.aggregation_cache.invalidate()
         for callback in self._after_update_callbacks:
             await callback(row, row_new)
         return self.serialize_one(row_new)
 
-    async def _delete(self, row):
-        res = await self.collection.delete_one({'_id': row['_id']})
-        if not res.deleted_count:
-            response.status = 404
-            return self.error_404()
+    async def _delete(self, row=None, query=None):
+        if query is not None and self._select_method != self._get_row:
+            #: custom fetchers may enforce access rules, so they still run
+            row = await self._select_method(query)
+            if not row:
+                response.status = 404
+                return self.error_404()
+            query = None
+        if query is not None:
+            with db_call():
+                row = await self.collection.find_one_and_delete(query.result)
+            if not row:
+                response.status = 404
+                return self.error_404()
+        else:
+            with db_call():
+                res = await self.collection.delete_one({'_id': row['_id']})
+            if not res.deleted_count:
+                response.status = 404
+                return self.error_404()
+        await self.aggregation_cache.invalidate()
         for callback in self._after_delete_callbacks:
             await callback(row)
         return {}
 
+    async def aggregate_rows(self, route, steps):
+        key = (route, freeze_data(steps))
+        return await self.aggregation_cache.fetch(
+            key,
+            lambda: self.coalesce(
+                key,
+                lambda: self.slow_query_log.observe(
+                    route, steps, None,
+                    lambda: self.collection.aggregate(
+                        steps, **self._max_time_kwargs(route)
+                    ).to_list(length=None),
+                    lambda: self.collection.database.command(
+                        'aggregate', self.collection.name,
+                        pipeline=steps, explain=True
+                    )
+                )
+            )
+        )
+
     #: additional routes
     async def _group(self, query, aggregation_steps, field):
         match = query.result
@@ -336,7 +1144,8 @@ class MongoRESTModule(_RESTModule):
             {'$project': {'_id': 0, 'value': '$_id', 'count': 1}},
             {'$sort': {key: val for key, val in sort}}
         ]
-        rows = await self.collection.aggregate(steps).to_list(length=None)
+        rows = await self.aggregate_rows('group', steps)
+        track_documents(len(rows))
         return self.pack_data(self.groups_envelope, rows)
 
     async def _stats(self, query, aggregation_steps, fields):
@@ -360,20 +1169,100 @@ class MongoRESTModule(_RESTModule):
             {'$group': grouper},
             {'$project': project}
         ]
-        rows = await self.collection.aggregate(steps).to_list(length=None)
+        rows = await self.aggregate_rows('stats', steps)
+        track_documents(len(rows))
         return rows[0] if rows else {
             field: {'mix': 0, 'max': 0, 'avg': 0} for field in fields
         }
 
-    async def _sample(self, query, aggregation_steps):
+    async def _sample(self, query, aggregation_steps, fields=None):
         match = query.result
         _, page_size = self.get_pagination()
         match_steps = [{'$match': match}] if match else []
         steps = aggregation_steps + match_steps + [
             {'$sample': {'size': page_size}}
         ]
-        rows = await self.collection.aggregate(steps).to_list(length=None)
-        return self.serialize_many(rows, (1, page_size), count=len(rows))
+        if query.projection:
+            steps.append({'$project': query.projection})
+        rows = await self.aggregate_rows('sample', steps)
+        return self.serialize_many(
+            rows, (1, page_size), count=len(rows), fields=fields
+        )
+
+    async def audit_indexes(self, create_missing=False):
+        advisor = IndexAdvisor(self)
+        if create_missing:
+            await advisor.create_missing()
+        return await advisor.audit()
+
+    @property
+    def query_cache_info(self) -> Dict[str, Dict[str, int]]:
+        return {
+            'query': self._json_query_pipe.cache.info(),
+            'aggregate': self._json_aggr_query_pipe.cache.info(),
+            'aggregation_results': self.aggregation_cache.info(),
+            'coalesced_reads': self._reads_flight.info()
+        }
+
+    @property
+    def _serializable_fields(self) -> List[str]:
+        return (
+            list(self.serializer.attributes) +
+            list(self.serializer._attrs_override_)
+        )
+
+    def get_export_format(self):
+        fmt = request.query_params.format
+        if isinstance(fmt, str) and fmt in self._export_formats:
+            return fmt
+        return self.export_format
+
+    async def _export_chunks(self, cursor, rows, fmt, fields):
+        first = True
+        if fmt == 'json':
+            yield b'['
+        while rows:
+            track_documents(len(rows))
+            #: batches are serialized at once to use the compiled serializer
+            data = _serialize(rows, self.serializer, fields=fields)
+            if fmt == 'ndjson':
+                chunk = '\n'.join([_json_dump(item) for item in data]) + '\n'
+            else:
+                chunk = ('' if first else ',') + _json_dump(data)[1:-1]
+            first = False
+            yield chunk.encode('utf8')
+            with db_call():
+                rows = await cursor.to_list(length=self.export_batch_size)
+        if fmt == 'json':
+            yield b']'
+
+    async def _export(self, query, fields=None):
+        fmt = self.get_export_format()
+        cursor = self.collection.find(
+            query.result,
+            projection=query.projection,
+            sort=self.get_sort(),
+            batch_size=self.export_batch_size
+        )
+        #: failures past the headers could only truncate the body,
+        #  so the first batch is loaded before streaming
+        try:
+            with db_call():
+                rows = await cursor.to_list(length=self.export_batch_size)
+        except ExecutionTimeout:
+            raise
+        except OperationFailure as exc:
+            return self._query_failure(exc)
+        response.headers['content-type'] = self._export_formats[fmt]
+        stream = HTTPStream(
+            200,
+            self._export_chunks(cursor, rows, fmt, fields),
+            headers=response.headers,
+            cookies=response.cookies
+        )
+        #: kills the server-side cursor when clients disconnect early
+        stream.on_close(cursor.close)
+        raise stream
 
     @property
     def allowed_sorts(self) -> List[str]:
@@ -391,6 +1280,14 @@ class MongoRESTModule(_RESTModule):
         self._fetcher_method = f
         return f
 
+    def on_500(self, f: Callable[..., Dict[str, Any]]):
+        self.error_500 = f
+        return f
+
+    def on_503(self, f: Callable[..., Dict[str, Any]]):
+        self.error_503 = f
+        return f
+
     def get_row(
         self,
         f: Callable[[MongoQuery], Awaitable[Optional[Dict[str, Any]]]]
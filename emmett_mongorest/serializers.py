@@ -9,7 +9,19 @@
     :license: BSD-3-Clause
 """
 
-from emmett_rest.serializers import Serializer as _Serializer
+from emmett_rest.serializers import (
+    Serializer as _Serializer,
+    serialize as _serialize
+)
+
+from .helpers import build_projection
+
+
+def requires(*fields):
+    def deco(f):
+        f._requires_ = fields
+        return f
+    return deco
 
 
 class Serializer(_Serializer):
@@ -29,6 +41,72 @@ class Serializer(_Serializer):
                 _attrs_override_.append(key)
         self._attrs_override_ = _attrs_override_
         self._init()
+        #: `_init` can still change attributes
+        self._projection_ = self._build_projection()
+        self._compiled_ = self._compile()
+
+    def _compile(self):
+        #: custom serialization logic can't be compiled
+        if (
+            type(self).__serialize__ is not Serializer.__serialize__ or
+            type(self).__call__ is not _Serializer.__call__
+        ):
+            return None
+        namespace, values = {'_str': str}, []
+        for key in self.attributes:
+            values.append(f'{key!r}: row[{key!r}]')
+        for idx, name in enumerate(self._attrs_override_):
+            if name == 'id' and type(self).id is Serializer.id:
+                values.append("'id': _str(row['_id'])")
+                continue
+            namespace[f'_m{idx}'] = getattr(self, name)
+            values.append(f'{name!r}: _m{idx}(row, **extras)')
+        lines = ['def serialize(row, **extras):']
+        if self.bind_to:
+            lines.append(f'    row = row[{self.bind_to!r}]')
+        lines.append('    return {' + ', '.join(values) + '}')
+        exec('\n'.join(lines), namespace)
+        return namespace['serialize']
+
+    def _build_projection(self, fields=None):
+        rv = ['_id']
+        for name in self.attributes:
+            if fields is None or name in fields:
+                rv.append(name)
+        for name in self._attrs_override_:
+            if fields is None or name in fields:
+                rv.extend(getattr(getattr(self, name), '_requires_', ()))
+        return build_projection(rv)
+
+    def __serialize__(self, row, fields=None, **extras):
+        if fields is None:
+            return super().__serialize__(row, **extras)
+        rv = {}
+        if self.bind_to:
+            row = row[self.bind_to]
+        for key in self.attributes:
+            if key in fields:
+                rv[key] = row[key]
+        for name in self._attrs_override_:
+            if name in fields:
+                rv[name] = getattr(self, name)(row, **extras)
+        return rv
 
     def id(self, obj):
         return str(obj['_id'])
+
+
+def serialize(objects, serializer, fields=None, **extras):
+    if fields is not None:
+        extras['fields'] = set(fields)
+        return _serialize(objects, serializer, **extras)
+    compiled = getattr(serializer, '_compiled_', None)
+    if compiled is None:
+        return _serialize(objects, serializer, **extras)
+    if objects is None:
+        return None
+    if not objects:
+        return []
+    if not isinstance(objects, (list, tuple)):
+        return compiled(objects, **extras)
+    return [compiled(obj, **extras) for obj in objects]
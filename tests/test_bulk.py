@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from pydantic import BaseModel
+
+
+class Sample(BaseModel):
+    string: str
+    number: int = 0
+
+
+@pytest.fixture(scope='function')
+def rest_app(app, db):
+    app.pipeline = [db.pipe]
+    app.mongorest_module(
+        __name__, 'sample', Sample, db.samples, url_prefix='sample',
+        enabled_methods=['index', 'bulk_create']
+    )
+    return app
+
+
+@pytest.fixture(scope='function', autouse=True)
+def db_sample(db):
+    with db.connection():
+        db.samples.create_index('string', unique=True)
+        db.samples.insert_one(Sample(string='foo').dict())
+
+
+@pytest.fixture(scope='function')
+def client(rest_app):
+    return rest_app.test_client()
+
+
+def test_bulk_create(client, json_load, json_dump):
+    body = [
+        {'string': 'bar', 'number': 1},
+        {'string': 'foo'},
+        {'number': 'baz'},
+        {'string': 'baz', 'number': 2}
+    ]
+    req = client.post(
+        '/sample/bulk',
+        data=json_dump(body),
+        headers=[('content-type', 'application/json')]
+    )
+    assert req.status == 207
+
+    data = json_load(req.data)
+    assert [el['index'] for el in data['data']] == [0, 1, 2, 3]
+    assert data['data'][0]['data']['string'] == 'bar'
+    assert data['data'][0]['data']['id']
+    assert data['data'][1]['errors'] == {'record': 'duplicated'}
+    assert data['data'][2]['errors']['string']
+    assert data['data'][3]['data']['number'] == 2
+    assert data['meta']['succeeded'] == 2
+    assert data['meta']['failed'] == 2
+
+    req = client.get('/sample')
+    data = json_load(req.data)
+    assert data['meta']['total_objects'] == 3
+
+
+def test_bulk_create_invalid(client, json_load, json_dump):
+    req = client.post(
+        '/sample/bulk',
+        data=json_dump({'string': 'bar'}),
+        headers=[('content-type', 'application/json')]
+    )
+    assert req.status == 400
+
+    req = client.post(
+        '/sample/bulk',
+        data=json_dump({'data': [{'string': 'bar'}]}),
+        headers=[('content-type', 'application/json')]
+    )
+    assert req.status == 201
+
+
+@pytest.fixture(scope='function')
+def rest_app_full(app, db):
+    app.pipeline = [db.pipe]
+    mod = app.mongorest_module(
+        __name__, 'sample_full', Sample, db.samples, url_prefix='sample_full',
+        enabled_methods=['index', 'bulk_update', 'bulk_delete']
+    )
+    mod.query_allowed_fields = ['string', 'number']
+    return app
+
+
+@pytest.fixture(scope='function')
+def client_full(rest_app_full):
+    return rest_app_full.test_client()
+
+
+@pytest.fixture(scope='function')
+def rows(db):
+    with db.connection():
+        db.samples.insert_many([
+            Sample(string='bar', number=1).dict(),
+            Sample(string='baz', number=1).dict()
+        ])
+        rv = list(db.samples.find({}).sort('string'))
+    return rv
+
+
+def test_bulk_update_ids(client_full, json_load, json_dump, rows):
+    body = [
+        {'id': str(rows[0]['_id']), 'attrs': {'number': 5}},
+        {'id': 'foo', 'attrs': {'number': 5}},
+        {'id': str(rows[1]['_id']), 'attrs': {'number': 'baz'}}
+    ]
+    req = client_full.patch(
+        '/sample_full/bulk',
+        data=json_dump(body),
+        headers=[('content-type', 'application/json')]
+    )
+    assert req.status == 207
+
+    data = json_load(req.data)
+    assert data['data'][0]['data']['number'] == 5
+    assert data['data'][1]['errors'] == {'id': 'invalid value'}
+    assert data['data'][2]['errors']['number']
+    assert data['meta']['matched'] == 1
+    assert data['meta']['modified'] == 1
+
+
+def test_bulk_update_where(client_full, json_load, json_dump, rows):
+    req = client_full.patch(
+        '/sample_full/bulk',
+        query_string={'where': json_dump({'number': 1})},
+        data=json_dump({'number': 3}),
+        headers=[('content-type', 'application/json')]
+    )
+    assert req.status == 200
+
+    data = json_load(req.data)
+    assert {el['data']['number'] for el in data['data']} == {3}
+    assert data['meta']['matched'] == 2
+
+    req = client_full.patch(
+        '/sample_full/bulk',
+        data=json_dump({'number': 3}),
+        headers=[('content-type', 'application/json')]
+    )
+    assert req.status == 400
+
+
+def test_bulk_delete(client_full, json_load, json_dump, rows):
+    req = client_full.delete(
+        '/sample_full/bulk',
+        data=json_dump([str(rows[0]['_id']), 'foo']),
+        headers=[('content-type', 'application/json')]
+    )
+    assert req.status == 207
+
+    data = json_load(req.data)
+    assert data['meta']['deleted'] == 1
+
+    req = client_full.delete(
+        '/sample_full/bulk',
+        query_string={'where': json_dump({'number': 1})}
+    )
+    assert req.status == 200
+
+    data = json_load(req.data)
+    assert data['meta']['deleted'] == 1
+
+    req = client_full.delete('/sample_full/bulk')
+    assert req.status == 400
+
+
+@pytest.mark.parametrize('callbacks', [False, True])
+def test_bulk_delete_where_cap(
+    rest_app_full, client_full, json_load, json_dump, db, rows, callbacks
+):
+    mod = rest_app_full._modules['sample_full']
+    mod.bulk_max_size = 1
+    deleted = []
+    if callbacks:
+        @mod.after_delete
+        async def after_delete(row):
+            deleted.append(row)
+
+    req = client_full.delete(
+        '/sample_full/bulk',
+        query_string={'where': json_dump({'number': 1})}
+    )
+    assert req.status == 400
+    assert json_load(req.data)['errors'] == {'where': 'too many records'}
+
+    with db.connection():
+        assert db.samples.count_documents({'number': 1}) == 2
+    assert not deleted
+
+
+@pytest.mark.parametrize('where', [{}, {'zz': 1}, {'$or': [{'zz': 1}]}])
+def test_bulk_empty_where(client_full, json_load, json_dump, db, rows, where):
+    req = client_full.patch(
+        '/sample_full/bulk',
+        query_string={'where': json_dump(where)},
+        data=json_dump({'number': 3}),
+        headers=[('content-type', 'application/json')]
+    )
+    assert req.status == 400
+    assert json_load(req.data)['errors'] == {'where': 'invalid value'}
+
+    req = client_full.delete(
+        '/sample_full/bulk',
+        query_string={'where': json_dump(where)}
+    )
+    assert req.status == 400
+    assert json_load(req.data)['errors'] == {'where': 'invalid value'}
+
+    with db.connection():
+        assert db.samples.count_documents({'number': 1}) == 2
+
+
+def test_bulk_parse_envelope(app, db, json_load, json_dump, rows):
+    app.pipeline = [db.pipe]
+    app.mongorest_module(
+        __name__, 'sample_envelope', Sample, db.samples,
+        url_prefix='sample_envelope',
+        enabled_methods=['bulk_create', 'bulk_update'],
+        single_envelope='sample', use_envelope_on_parse=True
+    )
+    client = app.test_client()
+    req = client.post(
+        '/sample_envelope/bulk',
+        data=json_dump([{'string': 'qux', 'number': 4}]),
+        headers=[('content-type', 'application/json')]
+    )
+    assert req.status == 201
+
+    req = client.patch(
+        '/sample_envelope/bulk',
+        data=json_dump([
+            {'id': str(rows[0]['_id']), 'attrs': {'number': 5}}
+        ]),
+        headers=[('content-type', 'application/json')]
+    )
+    assert req.status == 200
+
+    data = json_load(req.data)
+    assert data['data'][0]['data']['number'] == 5
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import pytest
+
+from emmett_mongorest.cache import (
+    MemoryCacheBackend,
+    ResultCache,
+    SingleFlight,
+    freeze_data
+)
+
+
+def test_freeze_data():
+    assert freeze_data({'a': [1, {'b': 2}]}) == freeze_data(
+        {'a': [1, {'b': 2}]}
+    )
+    assert freeze_data({'a': 1}) != freeze_data({'a': True})
+    assert freeze_data({'a': 1, 'b': 1}) != freeze_data({'b': 1, 'a': 1})
+
+
+@pytest.mark.asyncio
+async def test_result_cache():
+    calls = []
+
+    async def loader():
+        calls.append(None)
+        return [{'value': len(calls)}]
+
+    cache = ResultCache(MemoryCacheBackend(2), 60)
+    assert await cache.fetch('foo', loader) == [{'value': 1}]
+    assert await cache.fetch('foo', loader) == [{'value': 1}]
+    await cache.invalidate()
+    assert await cache.fetch('foo', loader) == [{'value': 2}]
+    assert cache.info()['hits'] == 1
+    assert cache.info()['misses'] == 2
+
+
+@pytest.mark.asyncio
+async def test_single_flight():
+    calls = []
+
+    async def loader():
+        calls.append(None)
+        await asyncio.sleep(0.01)
+        return [{'value': len(calls)}]
+
+    flight = SingleFlight()
+    rv = await asyncio.gather(*[flight.do('foo', loader) for _ in range(10)])
+    assert len(calls) == 1
+    assert all(el == [{'value': 1}] for el in rv)
+    assert rv[0] is not rv[1]
+    assert flight.info() == {'shared': 9, 'in_flight': 0}
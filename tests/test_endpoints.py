@@ -4,6 +4,7 @@ import pytest
 
 from datetime import datetime
 from emmett import sdict
+from emmett_mongorest.helpers import build_update_diff
 from pydantic import BaseModel
 
 
@@ -105,6 +106,40 @@ def test_create(client, json_load, json_dump):
     assert data['errors']['number']
 
 
+@pytest.mark.parametrize('refetch', [False, True])
+def test_create_refetch(app, db, json_load, json_dump, refetch):
+    app.pipeline = [db.pipe]
+    mod = app.mongorest_module(
+        __name__, 'sample_refetch', Sample, db.samples,
+        url_prefix='sample_refetch', enabled_methods=['create']
+    )
+    mod.refetch_on_create = refetch
+    created = []
+
+    @mod.after_create
+    async def after_create(row):
+        created.append(row)
+
+    body = sdict(
+        string='bar',
+        number=2,
+        precise=1.1,
+        dt=datetime(2000, 1, 1, 12, 30, 45, 123456)
+    )
+    req = app.test_client().post(
+        '/sample_refetch',
+        data=json_dump(body),
+        headers=[('content-type', 'application/json')]
+    )
+    assert req.status == 201
+
+    data = json_load(req.data)
+    with db.connection():
+        row = db.samples.find_one({'string': 'bar'})
+    assert data['id'] == str(row['_id'])
+    assert created == [row]
+
+
 def test_update(client, json_load, json_dump):
     body = sdict(
         string='bar',
@@ -149,6 +184,51 @@ def test_update(client, json_load, json_dump):
     assert data['errors']['number']
 
 
+def test_update_skips_coalescing(app, db, json_load, json_dump, row):
+    app.pipeline = [db.pipe]
+    mod = app.mongorest_module(
+        __name__, 'sample_coalesced', Sample, db.samples,
+        url_prefix='sample_coalesced'
+    )
+    mod.coalesce_reads = True
+    shared = []
+    coalesce = mod.coalesce
+
+    async def _coalesce(key, loader):
+        shared.append(key[0])
+        return await coalesce(key, loader)
+
+    mod.coalesce = _coalesce
+    client = app.test_client()
+    req = client.get(f"/sample_coalesced/{row['_id']}")
+    assert req.status == 200
+    assert shared == ['row']
+
+    #: write pre-images never join in-flight reads
+    req = client.put(
+        f"/sample_coalesced/{row['_id']}",
+        data=json_dump(sdict(string='baz')),
+        headers=[('content-type', 'application/json')]
+    )
+    assert req.status == 200
+    assert json_load(req.data)['string'] == 'baz'
+    assert shared == ['row']
+
+
+def test_update_diff():
+    row = {'_id': 1, 'a': 1, 'b': {'x': 1, 'y': 2}, 'c': [1], 'd': 'foo'}
+    assert build_update_diff(row, {'a': 1, 'd': 'foo'}) == {}
+    assert build_update_diff(
+        row, {'a': True, 'b': {'x': 2}, 'c': [1.0], 'e': 1}
+    ) == {
+        '$set': {'a': True, 'b.x': 2, 'c': [1.0], 'e': 1},
+        '$unset': {'b.y': ''}
+    }
+    assert build_update_diff(
+        {'b': {'$x': 1}}, {'b': {'$x': 2}}
+    ) == {'$set': {'b': {'$x': 2}}}
+
+
 def test_delete(client, db, row):
     req = client.delete(
         f"/sample/{row['_id']}",
@@ -158,3 +238,32 @@ def test_delete(client, db, row):
 
     with db.connection():
         assert not db.samples.count({})
+
+    req = client.delete(
+        f"/sample/{row['_id']}",
+        headers=[('content-type', 'application/json')]
+    )
+    assert req.status == 404
+
+
+def test_delete_custom_get_row(app, db, row):
+    app.pipeline = [db.pipe]
+    mod = app.mongorest_module(
+        __name__, 'sample_owned', Sample, db.samples,
+        url_prefix='sample_owned'
+    )
+
+    @mod.get_row
+    async def get_row(query):
+        query.where({'string': 'bar'})
+        return await mod.collection.find_one(query.result)
+
+    client = app.test_client()
+    req = client.delete(
+        f"/sample_owned/{row['_id']}",
+        headers=[('content-type', 'application/json')]
+    )
+    assert req.status == 404
+
+    with db.connection():
+        assert db.samples.count({}) == 1
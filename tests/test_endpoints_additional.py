@@ -78,3 +78,41 @@ def test_sample(client, json_load):
     data = json_load(req.data)
     assert data['meta']['total_objects'] == 3
     assert not data['meta']['has_more']
+
+
+@pytest.fixture(scope='function')
+def cached_mod(app, db):
+    app.pipeline = [db.pipe]
+    mod = app.mongorest_module(
+        __name__, 'sample_cached', Sample, db.samples,
+        url_prefix='sample_cached', enabled_methods=['create', 'group']
+    )
+    mod.grouping_allowed_fields = ['string']
+    mod.aggregation_cache.ttl = 60
+    return mod
+
+
+def test_aggregation_cache(cached_mod, json_load, json_dump):
+    client = cached_mod.app.test_client()
+    for _ in range(2):
+        req = client.get('/sample_cached/group/string')
+        assert req.status == 200
+
+        data = json_load(req.data)
+        assert data['meta']['total_objects'] == 2
+
+    info = cached_mod.aggregation_cache.info()
+    assert info['hits'] == 1
+    assert info['misses'] == 1
+
+    req = client.post(
+        '/sample_cached',
+        data=json_dump({'string': 'baz'}),
+        headers=[('content-type', 'application/json')]
+    )
+    assert req.status == 201
+
+    req = client.get('/sample_cached/group/string')
+    data = json_load(req.data)
+    assert data['meta']['total_objects'] == 3
+    assert cached_mod.aggregation_cache.info()['misses'] == 2
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from pydantic import BaseModel
+
+
+class Sample(BaseModel):
+    string: str = ""
+    version: int = 0
+
+
+@pytest.fixture(scope='function')
+def rest_app(app, db):
+    app.pipeline = [db.pipe]
+    mod = app.mongorest_module(
+        __name__, 'sample', Sample, db.samples, url_prefix='sample',
+        enabled_methods=['index', 'read']
+    )
+    mod.use_etag = True
+    mod_versioned = app.mongorest_module(
+        __name__, 'sample_versioned', Sample, db.samples,
+        url_prefix='sample_versioned', enabled_methods=['read']
+    )
+    mod_versioned.use_etag = True
+    mod_versioned.etag_field = 'version'
+    mod_versioned.etag_lookups = 0
+    get_record_etag = mod_versioned.get_record_etag
+
+    async def counted_get_record_etag(query):
+        mod_versioned.etag_lookups += 1
+        return await get_record_etag(query)
+
+    mod_versioned.get_record_etag = counted_get_record_etag
+    return app
+
+
+@pytest.fixture(scope='function', autouse=True)
+def db_sample(db):
+    with db.connection():
+        db.samples.insert_one(Sample(string='foo').dict())
+
+
+@pytest.fixture(scope='function')
+def client(rest_app):
+    return rest_app.test_client()
+
+
+@pytest.fixture(scope='function')
+def row(db):
+    with db.connection():
+        row = db.samples.find_one({})
+    return row
+
+
+@pytest.mark.parametrize('path', ['/sample', '/sample/{rid}'])
+def test_etag(client, row, path):
+    path = path.format(rid=row['_id'])
+    req = client.get(path)
+    assert req.status == 200
+
+    etag = req.headers['etag']
+    assert etag
+
+    req = client.get(path, headers=[('if-none-match', etag)])
+    assert req.status == 304
+
+    req = client.get(path, headers=[('if-none-match', '"foo"')])
+    assert req.status == 200
+    assert req.headers['etag'] == etag
+
+
+def test_etag_versioned(rest_app, client, db, row):
+    mod = rest_app._modules['sample_versioned']
+    path = f"/sample_versioned/{row['_id']}"
+    req = client.get(path)
+    assert req.status == 200
+    assert mod.etag_lookups == 0
+
+    etag = req.headers['etag']
+    req = client.get(path, headers=[('if-none-match', f'W/{etag}')])
+    assert req.status == 304
+
+    with db.connection():
+        db.samples.update_one({'_id': row['_id']}, {'$set': {'version': 1}})
+
+    req = client.get(path, headers=[('if-none-match', etag)])
+    assert req.status == 200
+    assert req.headers['etag'] != etag
+
+
+def test_etag_versioned_missing_field(rest_app, client, db, row):
+    rest_app._modules['sample_versioned'].etag_field = 'revision'
+    path = f"/sample_versioned/{row['_id']}"
+    req = client.get(path)
+    assert req.status == 200
+
+    etag = req.headers['etag']
+    req = client.get(path, headers=[('if-none-match', etag)])
+    assert req.status == 304
+
+    with db.connection():
+        db.samples.update_one({'_id': row['_id']}, {'$set': {'string': 'bar'}})
+
+    req = client.get(path, headers=[('if-none-match', etag)])
+    assert req.status == 200
+    assert req.headers['etag'] != etag
+
+
+def test_etag_versioned_stale_lookup(rest_app, client, row):
+    path = f"/sample_versioned/{row['_id']}"
+    etag = client.get(path).headers['etag']
+
+    async def stale_get_record_etag(query):
+        return '"stale"'
+
+    #: tags always come from the row the handler actually fetched
+    rest_app._modules['sample_versioned'].get_record_etag = \
+        stale_get_record_etag
+    req = client.get(path, headers=[('if-none-match', '"foo"')])
+    assert req.status == 200
+    assert req.headers['etag'] == etag
+
+
+def test_etag_versioned_custom_get_row(rest_app, db, client, row):
+    mod = rest_app.mongorest_module(
+        __name__, 'sample_hidden', Sample, db.samples,
+        url_prefix='sample_hidden', enabled_methods=['read']
+    )
+    mod.use_etag = True
+    mod.etag_field = 'version'
+
+    @mod.get_row
+    async def get_row(query):
+        return None
+
+    etag = client.get(f"/sample_versioned/{row['_id']}").headers['etag']
+    req = rest_app.test_client().get(
+        f"/sample_hidden/{row['_id']}", headers=[('if-none-match', etag)]
+    )
+    assert req.status == 404
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from emmett import current, sdict
+from emmett_mongorest.http import HTTPStream
+from pydantic import BaseModel
+from pymongo.errors import OperationFailure
+
+
+class Sample(BaseModel):
+    string: str = ""
+    number: int = 0
+
+
+@pytest.fixture(scope='function')
+def rest_app(app, db):
+    app.pipeline = [db.pipe]
+    mod = app.mongorest_module(
+        __name__, 'sample', Sample, db.samples, url_prefix='sample',
+        enabled_methods=['index', 'export']
+    )
+    mod.export_batch_size = 2
+    mod.query_allowed_fields = ['number']
+    mod.allowed_sorts = ['number']
+    return app
+
+
+@pytest.fixture(scope='function', autouse=True)
+def db_sample(db):
+    with db.connection():
+        db.samples.insert_many([
+            Sample(string=f'foo{idx}', number=idx).dict()
+            for idx in range(5)
+        ])
+
+
+@pytest.fixture(scope='function')
+def client(rest_app):
+    return rest_app.test_client()
+
+
+def test_export_ndjson(client, json_load):
+    req = client.get(
+        '/sample/export',
+        query_string={'sort_by': '-number', 'where': '{"number": {"$gt": 0}}'}
+    )
+    assert req.status == 200
+    assert req.headers['content-type'] == 'application/x-ndjson'
+
+    lines = req.data.strip().split('\n')
+    rows = [json_load(line) for line in lines]
+    assert [row['number'] for row in rows] == [4, 3, 2, 1]
+    assert {'id', 'string', 'number'} == set(rows[0].keys())
+
+
+def test_export_json(client, json_load):
+    req = client.get(
+        '/sample/export',
+        query_string={'format': 'json', 'sort_by': 'number', 'fields': 'id'}
+    )
+    assert req.status == 200
+    assert req.headers['content-type'] == 'application/json'
+
+    data = json_load(req.data)
+    assert len(data) == 5
+    assert all(set(row.keys()) == {'id'} for row in data)
+
+    req = client.get(
+        '/sample/export',
+        query_string={'format': 'json', 'where': '{"number": 10}'}
+    )
+    assert json_load(req.data) == []
+
+
+class _Cursor:
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.closed = False
+
+    async def to_list(self, length=None):
+        batch = self.batches.pop(0)
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
+
+    async def close(self):
+        self.closed = True
+
+
+class _Collection:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def find(self, *args, **kwargs):
+        return self.cursor
+
+
+def test_export_first_batch_failure(rest_app, client, json_load):
+    mod = rest_app._modules['sample']
+    mod.collection = _Collection(
+        _Cursor([OperationFailure('invalid query', 2)])
+    )
+    req = client.get('/sample/export')
+    assert req.status == 400
+    assert json_load(req.data)['errors'] == {'where': 'invalid value'}
+
+
+@pytest.mark.asyncio
+async def test_export_cursor_close(rest_app):
+    mod = rest_app._modules['sample']
+    cursor = _Cursor([[{'_id': 1, 'string': 'foo', 'number': 1}], []])
+    mod.collection = _Collection(cursor)
+    current.request = sdict(query_params=sdict())
+    current.response = sdict(status=200, headers={}, cookies={})
+
+    async def failing_send(message):
+        raise OSError('connection lost')
+
+    with pytest.raises(HTTPStream) as exc:
+        await mod._export(mod._fetcher_method())
+    with pytest.raises(OSError):
+        await exc.value._send_body(failing_send)
+    assert cursor.closed
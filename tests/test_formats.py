@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import bson
+import pytest
+
+from datetime import datetime, timezone
+from bson.objectid import ObjectId
+from emmett import current, sdict
+from emmett.http import HTTP
+from emmett_mongorest.formats import (
+    OBJECTID_EXT_TYPE,
+    FormatPipe,
+    build_formats,
+    encode_bson,
+    encode_msgpack,
+    negotiate
+)
+from emmett_mongorest.helpers import ETagPipe, variant_etag
+from emmett_mongorest.http import HTTPBytes
+
+msgpack = pytest.importorskip('msgpack')
+
+
+def test_negotiate():
+    available = build_formats(['msgpack', 'bson'])
+    assert negotiate(None, available) is None
+    assert negotiate('*/*', available) is None
+    assert negotiate('application/msgpack', available) == 'msgpack'
+    assert negotiate('application/x-msgpack', available) == 'msgpack'
+    assert negotiate('text/html, application/bson', available) == 'bson'
+    assert negotiate(
+        'application/json, application/bson;q=0.5', available
+    ) is None
+    assert negotiate(
+        'application/json;q=0.5, application/bson', available
+    ) == 'bson'
+    assert negotiate('application/bson', build_formats([])) is None
+    with pytest.raises(ValueError):
+        build_formats(['xml'])
+
+
+def test_encoders():
+    oid = ObjectId()
+    now = datetime(2020, 1, 1, 12, 30)
+    data = {'data': [{'id': str(oid), 'ref': oid, 'ts': now}]}
+
+    decoded = bson.decode(encode_bson(data))
+    assert decoded['data'][0]['ref'] == oid
+    assert decoded['data'][0]['ts'] == now
+
+    def ext_hook(code, value):
+        assert code == OBJECTID_EXT_TYPE
+        return ObjectId(value)
+
+    decoded = msgpack.unpackb(
+        encode_msgpack(data), ext_hook=ext_hook, timestamp=3
+    )
+    assert decoded['data'][0]['ref'] == oid
+    assert decoded['data'][0]['ts'] == now.replace(tzinfo=timezone.utc)
+
+
+@pytest.mark.asyncio
+async def test_format_pipe():
+    pipe = FormatPipe(sdict(), build_formats(['msgpack']))
+    data = {'data': [], 'meta': {'total_objects': 0}}
+
+    async def handler(**kwargs):
+        return data
+
+    current.request = sdict(headers={'accept': 'application/json'})
+    current.response = sdict(status=200, headers={}, cookies={})
+    assert await pipe.pipe_request(handler) == data
+    assert current.response.headers['vary'] == 'accept'
+
+    current.request = sdict(headers={'accept': 'application/msgpack'})
+    current.response = sdict(status=404, headers={}, cookies={})
+    with pytest.raises(HTTPBytes) as exc:
+        await pipe.pipe_request(handler)
+    assert exc.value.status_code == 404
+    assert exc.value.body == msgpack.packb(data)
+    assert current.response.headers['content-type'] == 'application/msgpack'
+
+
+@pytest.mark.asyncio
+async def test_format_etag():
+    available = build_formats(['bson'])
+    fake_mod = sdict(
+        use_etag=True,
+        get_response_format=lambda: negotiate(
+            current.request.headers.get('accept'), available
+        )
+    )
+    pipe = ETagPipe(fake_mod)
+
+    async def handler(**kwargs):
+        return {'data': []}
+
+    current.request = sdict(headers={})
+    current.response = sdict(status=200, headers={})
+    await pipe.pipe_request(handler)
+    etag = current.response.headers['etag']
+
+    current.request = sdict(
+        headers={'accept': 'application/bson', 'if-none-match': etag}
+    )
+    current.response = sdict(status=200, headers={})
+    await pipe.pipe_request(handler)
+    bson_etag = current.response.headers['etag']
+    assert bson_etag == variant_etag(etag, 'bson') != etag
+
+    current.request = sdict(
+        headers={'accept': 'application/bson', 'if-none-match': bson_etag}
+    )
+    current.response = sdict(status=200, headers={})
+    with pytest.raises(HTTP) as exc:
+        await pipe.pipe_request(handler)
+    assert exc.value.status_code == 304
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+from emmett import sdict
+from emmett_mongorest.indexes import IndexAdvisor, parse_sort
+
+
+def test_parse_sort():
+    assert parse_sort('-number,id') == [('number', -1), ('_id', 1)]
+    assert parse_sort('') == []
+
+
+def test_advisor():
+    fake_mod = sdict(
+        default_sort='-number',
+        pagination_mode='offset',
+        query_allowed_fields=['string', 'number', 'tags'],
+        allowed_sorts=['id', 'number', 'string'],
+        _groupable_fields=['string', 'number'],
+        _statsable_fields=['number', 'price']
+    )
+    advisor = IndexAdvisor(fake_mod)
+    report = advisor.analyze([[('_id', 1)], [('number', -1)]])
+    assert report['collscan_filters'] == ['string', 'tags']
+    assert report['blocking_sorts'] == ['string']
+    assert report['uncovered_groups'] == ['string']
+    assert report['uncovered_stats'] == ['price']
+    assert report['suggestions'] == [
+        [('string', 1), ('number', -1)],
+        [('tags', 1), ('number', -1)]
+    ]
+
+    fake_mod.pagination_mode = 'keyset'
+    report = advisor.analyze([
+        [('_id', 1)],
+        [('string', 1), ('number', -1), ('_id', -1)]
+    ])
+    assert report['collscan_filters'] == ['number', 'tags']
+    assert report['blocking_sorts'] == ['number']
+    assert report['suggestions'] == [
+        [('number', -1), ('_id', -1)],
+        [('tags', 1), ('number', -1), ('_id', -1)]
+    ]
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import pytest
+
+from emmett import current, sdict
+from emmett_mongorest.http import HTTPStream
+from emmett_mongorest.limits import ConcurrencyLimit, LimiterPipe
+from pydantic import BaseModel
+
+
+class Sample(BaseModel):
+    string: str = ""
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit():
+    limit = ConcurrencyLimit(1, queue_size=1)
+    assert await limit.acquire()
+    waiter = asyncio.ensure_future(limit.acquire())
+    await asyncio.sleep(0)
+    assert not await limit.acquire()
+    assert limit.info() == {
+        'concurrency': 1, 'active': 1, 'waiting': 1,
+        'queued': 1, 'rejected': 1
+    }
+    limit.release()
+    assert await waiter
+    limit.release()
+    assert limit.info()['active'] == 0
+
+
+@pytest.mark.asyncio
+async def test_limiter_pipe():
+    fake_mod = sdict(
+        name='sample',
+        use_metrics=False,
+        concurrency_reject_status=429,
+        concurrency_retry_after=2,
+        error_503=lambda errors: {'errors': errors}
+    )
+    current.response = sdict(status=200, headers={})
+    limit = ConcurrencyLimit(1)
+    fake_mod._route_limits = lambda route: [limit]
+    pipe = LimiterPipe(fake_mod, 'group')
+    event = asyncio.Event()
+
+    async def handler(**kwargs):
+        await event.wait()
+        return kwargs
+
+    task = asyncio.ensure_future(pipe.pipe_request(handler, foo=1))
+    await asyncio.sleep(0)
+    rv = await pipe.pipe_request(handler)
+    assert rv == {'errors': {'request': 'too many requests'}}
+    assert current.response.status == 429
+    assert current.response.headers['retry-after'] == '2'
+
+    event.set()
+    assert await task == {'foo': 1}
+    assert limit.info()['active'] == 0
+
+
+@pytest.mark.asyncio
+async def test_limiter_pipe_stream():
+    limit = ConcurrencyLimit(1)
+    fake_mod = sdict(_route_limits=lambda route: [limit])
+    pipe = LimiterPipe(fake_mod, 'export')
+
+    async def chunks():
+        yield b'foo'
+        yield b'bar'
+
+    async def handler(**kwargs):
+        raise HTTPStream(200, chunks())
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    with pytest.raises(HTTPStream) as exc:
+        await pipe.pipe_request(handler)
+    assert limit.info()['active'] == 1
+
+    await exc.value._send_body(send)
+    assert [message['body'] for message in sent] == [b'foo', b'bar', b'']
+    assert limit.info()['active'] == 0
+
+    async def failing_send(message):
+        raise OSError('connection lost')
+
+    #: slots are released even if the body is never iterated
+    with pytest.raises(HTTPStream) as exc:
+        await pipe.pipe_request(handler)
+    assert limit.info()['active'] == 1
+    with pytest.raises(OSError):
+        await exc.value._send_headers(failing_send)
+    assert limit.info()['active'] == 0
+
+
+def test_module_limits(app, db):
+    app.pipeline = [db.pipe]
+    mod = app.mongorest_module(
+        __name__, 'sample_limited', Sample, db.samples,
+        url_prefix='sample_limited', enabled_methods=['index']
+    )
+    assert mod._route_limits('index') == []
+
+    mod.set_concurrency_limits({'read': 2, 'write': 0})
+    assert list(mod.concurrency_limits) == ['read']
+    assert mod._route_limits('index') == [mod.concurrency_limits['read']]
+    assert mod.concurrency_info['read']['concurrency'] == 2
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from emmett import current, sdict
+from emmett.http import HTTP
+from emmett_mongorest.helpers import QueryTimeoutPipe
+from emmett_mongorest.http import HTTPStream
+from emmett_mongorest.metrics import (
+    MetricsPipe,
+    MetricsRegistry,
+    RESTMetrics,
+    track_commands,
+    track_documents
+)
+from pymongo.errors import ExecutionTimeout
+
+
+def test_registry_render():
+    registry = MetricsRegistry()
+    registry.describe('hits_total', 'Hits')
+    registry.inc('hits_total', (('module', 'sample'),))
+    registry.inc('hits_total', (('module', 'sample'),), 2)
+    registry.observe('size', (), 3, (1, 5))
+    registry.observe('size', (), 10, (1, 5))
+    assert registry.render().splitlines() == [
+        '# HELP mongorest_hits_total Hits',
+        '# TYPE mongorest_hits_total counter',
+        'mongorest_hits_total{module="sample"} 3',
+        '# TYPE mongorest_size histogram',
+        'mongorest_size_bucket{le="1"} 0',
+        'mongorest_size_bucket{le="5"} 1',
+        'mongorest_size_bucket{le="+Inf"} 2',
+        'mongorest_size_sum 13',
+        'mongorest_size_count 2'
+    ]
+
+
+@pytest.mark.asyncio
+async def test_metrics_pipe():
+    fake_mod = sdict(name='sample', ext=sdict(metrics=RESTMetrics()))
+    current.response = sdict(status=200)
+    pipe = MetricsPipe(fake_mod, 'index')
+
+    async def handler(**kwargs):
+        track_commands(2)
+        track_documents(5)
+        return kwargs
+
+    async def failing_handler(**kwargs):
+        raise HTTP(404)
+
+    assert await pipe.pipe_request(handler, foo=1) == {'foo': 1}
+    with pytest.raises(HTTP):
+        await pipe.pipe_request(failing_handler)
+
+    metrics = fake_mod.ext.metrics
+    labels = (('module', 'sample'), ('route', 'index'))
+    assert metrics.counters['requests_total'] == {
+        labels + (('status', '200'),): 1,
+        labels + (('status', '404'),): 1
+    }
+    assert metrics.histograms['request_mongo_commands'][labels].sum == 2
+    assert metrics.histograms['request_documents'][labels].sum == 5
+    assert metrics.histograms['request_duration_seconds'][labels].count == 2
+
+
+@pytest.mark.asyncio
+async def test_metrics_pipe_stream():
+    fake_mod = sdict(name='sample', ext=sdict(metrics=RESTMetrics()))
+    current.response = sdict(status=200)
+    pipe = MetricsPipe(fake_mod, 'export')
+
+    async def chunks():
+        for _ in range(3):
+            track_commands()
+            track_documents(2)
+            yield b'foo'
+
+    async def handler(**kwargs):
+        track_commands()
+        raise HTTPStream(200, chunks())
+
+    async def send(message):
+        pass
+
+    with pytest.raises(HTTPStream) as exc:
+        await pipe.pipe_request(handler)
+    metrics = fake_mod.ext.metrics
+    assert 'requests_total' not in metrics.counters
+
+    #: requests are recorded once the streamed body is sent
+    await exc.value._send_body(send)
+    labels = (('module', 'sample'), ('route', 'export'))
+    assert metrics.counters['requests_total'] == {
+        labels + (('status', '200'),): 1
+    }
+    assert metrics.histograms['request_mongo_commands'][labels].sum == 4
+    assert metrics.histograms['request_documents'][labels].sum == 6
+
+
+@pytest.mark.asyncio
+async def test_query_timeout_pipe():
+    fake_mod = sdict(
+        name='sample',
+        use_metrics=True,
+        ext=sdict(metrics=RESTMetrics()),
+        error_503=lambda errors: {'errors': errors}
+    )
+    current.response = sdict(status=200)
+    pipe = QueryTimeoutPipe(fake_mod, 'group')
+
+    async def handler(**kwargs):
+        raise ExecutionTimeout('operation exceeded time limit', 50)
+
+    rv = await pipe.pipe_request(handler)
+    assert current.response.status == 503
+    assert rv == {'errors': {'query': 'execution timeout'}}
+    assert fake_mod.ext.metrics.counters['query_timeouts_total'] == {
+        (('module', 'sample'), ('route', 'group')): 1
+    }
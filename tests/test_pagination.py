@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from pydantic import BaseModel
+from pymongo.errors import OperationFailure
+from typing import Optional
+
+
+class Sample(BaseModel):
+    string: str = ""
+    number: int = 0
+
+
+class NullableSample(BaseModel):
+    string: str = ""
+    score: Optional[int] = None
+
+
+@pytest.fixture(scope='function')
+def mod(app, db):
+    app.pipeline = [db.pipe]
+    rv = app.mongorest_module(
+        __name__, 'sample', Sample, db.samples, url_prefix='sample'
+    )
+    rv.pagination_mode = 'keyset'
+    rv.allowed_sorts = ['number']
+    return rv
+
+
+@pytest.fixture(scope='function')
+def rest_app(app, mod):
+    return app
+
+
+@pytest.fixture(scope='function', autouse=True)
+def db_sample(db):
+    with db.connection():
+        db.samples.insert_many([
+            Sample(string=f'foo{idx}', number=idx % 3).dict()
+            for idx in range(5)
+        ])
+
+
+@pytest.fixture(scope='function')
+def client(rest_app):
+    return rest_app.test_client()
+
+
+@pytest.mark.parametrize('query_mode', ['sequential', 'facet'])
+def test_keyset_pagination(mod, client, json_load, query_mode):
+    mod.index_query_mode = query_mode
+    facet_calls = []
+    fetch_page_facet = mod._fetch_page_facet
+
+    async def _fetch_page_facet(*args, **kwargs):
+        facet_calls.append(args)
+        return await fetch_page_facet(*args, **kwargs)
+
+    mod._fetch_page_facet = _fetch_page_facet
+    req = client.get(
+        '/sample',
+        query_string={'sort_by': 'number', 'page_size': 2}
+    )
+    assert req.status == 200
+
+    data = json_load(req.data)
+    assert [el['number'] for el in data['data']] == [0, 0]
+    assert data['meta']['total_objects'] == 5
+    assert data['meta']['has_more']
+    assert data['meta']['next']
+    assert data['meta']['prev'] is None
+    first_page = [el['id'] for el in data['data']]
+
+    req = client.get(
+        '/sample',
+        query_string={
+            'sort_by': 'number', 'page_size': 2,
+            'cursor': data['meta']['next']
+        }
+    )
+    data = json_load(req.data)
+    assert [el['number'] for el in data['data']] == [1, 1]
+    assert data['meta']['prev']
+
+    req = client.get(
+        '/sample',
+        query_string={
+            'sort_by': 'number', 'page_size': 2,
+            'cursor': data['meta']['next']
+        }
+    )
+    data = json_load(req.data)
+    assert [el['number'] for el in data['data']] == [2]
+    assert not data['meta']['has_more']
+    assert data['meta']['next'] is None
+
+    req = client.get(
+        '/sample',
+        query_string={
+            'sort_by': 'number', 'page_size': 2,
+            'cursor': data['meta']['prev']
+        }
+    )
+    data = json_load(req.data)
+    assert [el['number'] for el in data['data']] == [1, 1]
+
+    req = client.get(
+        '/sample',
+        query_string={
+            'sort_by': 'number', 'page_size': 2,
+            'cursor': data['meta']['prev']
+        }
+    )
+    data = json_load(req.data)
+    assert [el['id'] for el in data['data']] == first_page
+    assert data['meta']['prev'] is None
+    #: only the first page has no keyset condition to run in a $facet
+    assert len(facet_calls) == (1 if query_mode == 'facet' else 0)
+
+
+@pytest.fixture(scope='function')
+def nullable_client(app, db):
+    app.pipeline = [db.pipe]
+    mod = app.mongorest_module(
+        __name__, 'nullable', NullableSample, db.samples,
+        url_prefix='nullable'
+    )
+    mod.pagination_mode = 'keyset'
+    mod.allowed_sorts = ['score']
+    with db.connection():
+        db.samples.delete_many({})
+        db.samples.insert_many([
+            NullableSample(string=f'foo{idx}', score=score).dict()
+            for idx, score in enumerate([1, None, 2, None, 3, None])
+        ])
+    return app.test_client()
+
+
+@pytest.mark.parametrize('sort_by', ['-score', 'score'])
+def test_keyset_nullable_sort(nullable_client, json_load, sort_by):
+    pages, cursor = [], None
+    while True:
+        query_string = {'sort_by': sort_by, 'page_size': 2}
+        if cursor:
+            query_string['cursor'] = cursor
+        req = nullable_client.get('/nullable', query_string=query_string)
+        assert req.status == 200
+
+        data = json_load(req.data)
+        pages.append([el['score'] for el in data['data']])
+        cursor = data['meta']['next']
+        if not cursor:
+            break
+    scores = [score for page in pages for score in page]
+    nulls = [None, None, None]
+    assert scores == (
+        [3, 2, 1] + nulls if sort_by.startswith('-') else nulls + [1, 2, 3]
+    )
+
+    #: walking back from the last page reaches the first one
+    prev_pages = [pages[-1]]
+    cursor = data['meta']['prev']
+    while cursor:
+        req = nullable_client.get(
+            '/nullable',
+            query_string={
+                'sort_by': sort_by, 'page_size': 2, 'cursor': cursor
+            }
+        )
+        data = json_load(req.data)
+        prev_pages.insert(0, [el['score'] for el in data['data']])
+        cursor = data['meta']['prev']
+    assert prev_pages == pages
+
+
+def test_keyset_invalid_cursor(client, json_load):
+    req = client.get('/sample', query_string={'cursor': 'foo'})
+    assert req.status == 400
+
+    data = json_load(req.data)
+    assert data['errors']['cursor']
+
+
+@pytest.mark.parametrize(
+    'count_mode,total',
+    [('exact', 5), ('estimated', 5), ('capped', 5), ('none', None)]
+)
+def test_count_modes(mod, client, json_load, count_mode, total):
+    mod.pagination_mode = 'offset'
+    mod.count_mode = count_mode
+    req = client.get('/sample', query_string={'page_size': 2})
+    assert req.status == 200
+
+    data = json_load(req.data)
+    assert len(data['data']) == 2
+    assert data['meta']['total_objects'] == total
+    assert data['meta']['has_more']
+    if count_mode != 'exact':
+        assert data['meta']['count_mode'] == count_mode
+
+    req = client.get('/sample', query_string={'page': 3, 'page_size': 2})
+    data = json_load(req.data)
+    assert len(data['data']) == 1
+    assert not data['meta']['has_more']
+
+
+def test_count_capped(mod, client, json_load):
+    mod.pagination_mode = 'offset'
+    mod.count_mode = 'capped'
+    mod.count_cap = 3
+    req = client.get('/sample', query_string={'page_size': 2})
+    data = json_load(req.data)
+    assert data['meta']['total_objects'] == 3
+    assert data['meta']['count_mode'] == 'capped'
+    assert data['meta']['has_more']
+
+
+@pytest.mark.parametrize('query_mode', ['sequential', 'concurrent', 'facet'])
+def test_index_query_modes(mod, client, json_load, query_mode):
+    mod.pagination_mode = 'offset'
+    mod.index_query_mode = query_mode
+    mod.allowed_sorts = ['number']
+    req = client.get(
+        '/sample',
+        query_string={'page': 2, 'page_size': 2, 'sort_by': '-number'}
+    )
+    assert req.status == 200
+
+    data = json_load(req.data)
+    assert [el['number'] for el in data['data']] == [1, 0]
+    assert data['meta']['total_objects'] == 5
+    assert data['meta']['has_more']
+
+
+@pytest.mark.parametrize('code,status', [(2, 400), (96, 500)])
+def test_index_query_failure(mod, client, json_load, code, status):
+    mod.pagination_mode = 'offset'
+
+    async def _load_page(*args, **kwargs):
+        raise OperationFailure('query failed', code)
+
+    mod._load_page = _load_page
+    req = client.get('/sample')
+    assert req.status == status
+
+    data = json_load(req.data)
+    if status == 400:
+        assert data['errors']['where'] == 'invalid value'
+    else:
+        assert data['errors']['query'] == 'execution failed'
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import pytest
+
+from emmett import current, sdict
+from emmett.parsers import Parsers
+from emmett.pipeline import Pipe
+from emmett_mongorest.http import HTTPBytes, HTTPStream
+from emmett_mongorest.profiling import (
+    ServerTimingPipe,
+    SlowQueryLog,
+    query_shape,
+    summarize_explain,
+    time_handler,
+    time_pipe,
+    timing
+)
+from pymongo.errors import ExecutionTimeout
+
+
+def test_query_shape():
+    assert query_shape({
+        '$and': [{'string': 'foo'}, {'number': {'$in': [1, 2]}}]
+    }) == {'$and': [{'string': '?'}, {'number': {'$in': '?'}}]}
+
+
+def test_summarize_explain():
+    plan = {
+        'stage': 'SORT',
+        'inputStage': {'stage': 'COLLSCAN'}
+    }
+    assert summarize_explain({'queryPlanner': {'winningPlan': plan}}) == {
+        'stages': ['SORT', 'COLLSCAN'],
+        'collscan': True,
+        'blocking_sort': True
+    }
+    plan = {
+        'stage': 'FETCH',
+        'inputStage': {'stage': 'IXSCAN'}
+    }
+    assert summarize_explain({
+        'stages': [{'$cursor': {'queryPlanner': {'winningPlan': plan}}}]
+    }) == {
+        'stages': ['FETCH', 'IXSCAN'],
+        'collscan': False,
+        'blocking_sort': False
+    }
+
+
+_explain = {
+    'queryPlanner': {
+        'winningPlan': {'stage': 'SORT', 'inputStage': {'stage': 'COLLSCAN'}}
+    }
+}
+
+
+def _slow_query_log(threshold=None, explain_rate=0.0, explain_header=None):
+    logs = []
+    fake_mod = sdict(
+        name='sample',
+        app=sdict(debug=True, log=sdict(warning=logs.append))
+    )
+    log = SlowQueryLog(fake_mod, threshold, explain_rate, explain_header)
+    return log, logs
+
+
+@pytest.mark.asyncio
+async def test_slow_query_log(monkeypatch):
+    explained = []
+
+    async def loader():
+        return [1]
+
+    async def explainer():
+        explained.append(None)
+        return _explain
+
+    current.request = sdict(headers={})
+    current.response = sdict(headers={})
+
+    log, logs = _slow_query_log(threshold=1000)
+    assert await log.observe('index', {'a': 1}, None, loader, explainer) == [1]
+    assert not logs
+
+    log, logs = _slow_query_log(threshold=0)
+    await log.observe('index', {'a': 1}, None, loader, explainer)
+    assert logs[0].startswith('slow mongo query on sample.index')
+    assert "filter={'a': '?'}" in logs[0]
+    assert 'plan=' not in logs[0]
+    assert not explained
+
+    monkeypatch.setattr('emmett_mongorest.profiling.random.random', lambda: .5)
+    log, logs = _slow_query_log(threshold=0, explain_rate=0.4)
+    await log.observe('index', {'a': 1}, None, loader, explainer)
+    assert not explained
+    log, logs = _slow_query_log(threshold=0, explain_rate=0.6)
+    await log.observe('index', {'a': 1}, None, loader, explainer)
+    assert len(explained) == 1
+    assert logs[0].endswith('plan=SORT>COLLSCAN [COLLSCAN] [SORT]')
+
+
+@pytest.mark.asyncio
+async def test_slow_query_log_failure():
+    explained = []
+
+    async def loader():
+        await asyncio.sleep(0.01)
+        raise ExecutionTimeout('operation exceeded time limit', 50)
+
+    async def explainer():
+        explained.append(None)
+        return _explain
+
+    current.request = sdict(headers={})
+    current.response = sdict(headers={})
+    log, logs = _slow_query_log(threshold=1000, explain_rate=1.0)
+    with pytest.raises(ExecutionTimeout):
+        await log.observe('index', {'a': 1}, None, loader, explainer)
+    assert 'failed=ExecutionTimeout' in logs[0]
+    assert not explained
+
+
+@pytest.mark.asyncio
+async def test_slow_query_log_inline_plan():
+    async def loader():
+        return [1]
+
+    async def explainer():
+        return _explain
+
+    current.request = sdict(headers={'x-explain': '1'})
+    current.response = sdict(headers={})
+    log, logs = _slow_query_log(explain_header='x-explain')
+    await log.observe('index', {}, None, loader, explainer)
+    await log.observe('count', {}, None, loader, explainer)
+    assert current.response.headers[log.plan_header] == (
+        'index;stages=SORT>COLLSCAN, count;stages=SORT>COLLSCAN'
+    )
+    assert not logs
+
+    log.mod.app.debug = False
+    current.response = sdict(headers={})
+    await log.observe('index', {}, None, loader, explainer)
+    assert log.plan_header not in current.response.headers
+
+
+class _SlowPipe(Pipe):
+    async def pipe_request(self, next_pipe, **kwargs):
+        await asyncio.sleep(0.01)
+        return await next_pipe(**kwargs)
+
+
+@pytest.mark.asyncio
+async def test_server_timing():
+    sink = []
+    fake_mod = sdict(
+        timing_sink=lambda mod, route, data: sink.append((route, data))
+    )
+    current.response = sdict(status=200, headers={}, cookies={})
+
+    async def handler(**kwargs):
+        with timing('db'):
+            await asyncio.sleep(0.01)
+        return kwargs
+
+    pipe = time_pipe(_SlowPipe())
+    assert time_pipe(pipe).pipe_request is pipe.pipe_request
+    timed_handler = time_handler(handler)
+
+    async def flow(**kwargs):
+        return await pipe.pipe_request(timed_handler, **kwargs)
+
+    with pytest.raises(HTTPBytes) as exc:
+        await ServerTimingPipe(fake_mod, 'index').pipe_request(flow, foo=1)
+    assert Parsers.get_for('json')(exc.value.body) == {'foo': 1}
+    assert current.response.headers['content-type'] == 'application/json'
+    route, data = sink[0]
+    assert route == 'index'
+    assert set(data) == {'_SlowPipe', 'db', 'handler', 'json', 'total'}
+    assert data['_SlowPipe'] >= 0.01
+    assert data['db'] >= 0.01
+    assert data['handler'] < 0.01
+    assert 'db;dur=' in current.response.headers['server-timing']
+
+
+@pytest.mark.asyncio
+async def test_server_timing_stream():
+    sink = []
+    fake_mod = sdict(
+        timing_sink=lambda mod, route, data: sink.append((route, data))
+    )
+    current.response = sdict(status=200, headers={}, cookies={})
+
+    async def chunks():
+        for chunk in [b'foo', b'bar']:
+            with timing('db'):
+                await asyncio.sleep(0.01)
+            yield chunk
+
+    async def handler(**kwargs):
+        raise HTTPStream(200, chunks())
+
+    async def send(message):
+        pass
+
+    with pytest.raises(HTTPStream) as exc:
+        await ServerTimingPipe(fake_mod, 'export').pipe_request(handler)
+    assert 'total;dur=' in current.response.headers['server-timing']
+    assert not sink
+
+    #: batches fetched while streaming reach the sink once closed
+    await exc.value._send_body(send)
+    route, data = sink[0]
+    assert route == 'export'
+    assert data['db'] >= 0.02
+    assert data['total'] >= data['db']
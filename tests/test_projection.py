@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from emmett_mongorest import Serializer
+from emmett_mongorest.serializers import requires, serialize
+from pydantic import BaseModel
+from typing import List
+
+
+class Sample(BaseModel):
+    string: str = ""
+    number: int = 0
+    tags: List[str] = []
+    history: List[int] = []
+
+
+class SampleSerializer(Serializer):
+    exclude = ['tags', 'history']
+
+    @requires('tags')
+    def tags_count(self, obj) -> int:
+        return len(obj['tags'])
+
+    def has_history(self, obj) -> bool:
+        return 'history' in obj
+
+
+@pytest.fixture(scope='function')
+def rest_app(app, db):
+    app.pipeline = [db.pipe]
+    mod = app.mongorest_module(
+        __name__, 'sample', Sample, db.samples, url_prefix='sample',
+        serializer=SampleSerializer,
+        enabled_methods=['index', 'read', 'update', 'sample']
+    )
+    mod.use_projection = True
+    return app
+
+
+@pytest.fixture(scope='function', autouse=True)
+def db_sample(db):
+    with db.connection():
+        db.samples.insert_one(
+            Sample(
+                string='foo', tags=['a', 'b'], history=list(range(10))
+            ).dict()
+        )
+
+
+@pytest.fixture(scope='function')
+def client(rest_app):
+    return rest_app.test_client()
+
+
+@pytest.fixture(scope='function')
+def row(db):
+    with db.connection():
+        row = db.samples.find_one({})
+    return row
+
+
+def test_serializer_projection():
+    serializer = SampleSerializer(Sample)
+    assert serializer._projection_ == {
+        '_id': 1, 'string': 1, 'number': 1, 'tags': 1
+    }
+
+
+def test_serializer_projection_init():
+    class InitSerializer(SampleSerializer):
+        def _init(self):
+            self.attributes.append('history')
+
+    serializer = InitSerializer(Sample)
+    assert serializer._projection_ == {
+        '_id': 1, 'string': 1, 'number': 1, 'history': 1, 'tags': 1
+    }
+
+
+@pytest.mark.parametrize('path', ['/sample', '/sample/sample'])
+def test_list_projection(client, json_load, path):
+    req = client.get(path)
+    assert req.status == 200
+
+    data = json_load(req.data)
+    assert data['data'][0]['tags_count'] == 2
+    assert not data['data'][0]['has_history']
+
+
+def test_read_projection(client, json_load, json_dump, row):
+    req = client.get(f"/sample/{row['_id']}")
+    assert req.status == 200
+
+    data = json_load(req.data)
+    assert {'id', 'string', 'number', 'tags_count', 'has_history'} == set(
+        data.keys())
+    assert not data['has_history']
+
+    req = client.put(
+        f"/sample/{row['_id']}",
+        data=json_dump({'number': 2}),
+        headers=[('content-type', 'application/json')]
+    )
+    assert req.status == 200
+
+    data = json_load(req.data)
+    assert data['has_history']
+
+
+def test_sparse_fieldsets(client, json_load, row):
+    req = client.get('/sample', query_string={'fields': 'string,tags_count'})
+    assert req.status == 200
+
+    data = json_load(req.data)
+    assert data['data'][0] == {'string': 'foo', 'tags_count': 2}
+    assert data['meta']['total_objects'] == 1
+
+    req = client.get(
+        f"/sample/{row['_id']}",
+        query_string={'fields': 'id,number,has_history,foo'}
+    )
+    assert req.status == 200
+
+    data = json_load(req.data)
+    assert data == {'id': str(row['_id']), 'number': 0, 'has_history': False}
+
+    req = client.get('/sample', query_string={'fields': 'foo'})
+    assert req.status == 400
+
+    data = json_load(req.data)
+    assert data['errors']['fields']
+
+
+def test_compiled_serializer(row):
+    serializer = SampleSerializer(Sample)
+    assert serializer._compiled_ is not None
+    assert serializer._compiled_(row) == super(
+        Serializer, serializer
+    ).__serialize__(row)
+    assert list(serializer._compiled_(row)) == [
+        'string', 'number', 'has_history', 'id', 'tags_count'
+    ]
+    assert serialize([row], serializer) == [serializer(row)]
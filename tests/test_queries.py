@@ -133,6 +133,29 @@ def test_parse_combined():
     }
 
 
+def test_parse_errors():
+    with pytest.raises(QueryError):
+        parse_conditions(MongoQuery(), {'$or': [1]}, {'string'})
+    with pytest.raises(QueryError):
+        parse_conditions(MongoQuery(), {'$or': {'string': 'foo'}}, {'string'})
+    with pytest.raises(QueryError):
+        parse_conditions(MongoQuery(), {'$not': 'foo'}, {'string'})
+    with pytest.raises(QueryError):
+        parse_conditions(
+            MongoQuery(), {'string': {'$id.in': 'foo'}}, {'string'}
+        )
+
+
+def test_parse_deep():
+    qdict = {'number': {'$gt': 0}}
+    expected = {'number': {'$gt': 0}}
+    for _ in range(200):
+        qdict = {'$and': [qdict, {'foo': 'bar'}]}
+        expected = {'$and': [expected]}
+    parsed = parse_conditions(MongoQuery(), qdict, {'number'})
+    assert parsed.result == {'$and': [expected]}
+
+
 def test_parse_geo():
     qdict = {
         '$or': [
@@ -424,3 +447,68 @@ async def test_pipes(db, json_dump):
             'minDistance': 2000
         }
     }]
+
+
+@pytest.mark.asyncio
+async def test_pipes_cache(db, json_dump):
+    fake_mod = sdict(
+        _queryable_fields=['string', 'number', 'geo'],
+        model=Sample,
+        query_cache_size=2,
+        error_400=lambda errors: {'errors': errors},
+        ext=sdict(
+            config=sdict(
+                query_param='where'
+            )
+        )
+    )
+    pipe = JSONQueryPipe(fake_mod)
+    pipe_aggr = AggregateJSONQueryPipe(fake_mod)
+
+    qdict = {
+        'string': 'foo',
+        'number': {'$gt': 0},
+        'geo': {
+            '$geo.near': {
+                'coordinates': {'lat': 44.10, 'lon': 16.10},
+                'distance': {'min': 2000, 'max': 5000}
+            }
+        }
+    }
+    current.request = sdict(
+        query_params=sdict(
+            where=json_dump(qdict)
+        )
+    )
+    results = []
+    for _ in range(3):
+        res = await pipe_aggr.pipe_request(_fake_pipe, query=MongoQuery())
+        results.append(res)
+    assert pipe_aggr.cache.info() == {
+        'hits': 2, 'misses': 1, 'size': 1, 'maxsize': 2
+    }
+    for res in results:
+        assert res['query'].result == {'$and': [{
+            'string': 'foo',
+            'number': {'$gt': 0}
+        }]}
+        assert res['aggregation_steps'][0]['$geoNear']['key'] == 'geo'
+    assert (
+        results[1]['aggregation_steps'][0] is not
+        results[2]['aggregation_steps'][0]
+    )
+
+    res = await pipe.pipe_request(_fake_pipe, query=MongoQuery())
+    assert pipe.cache.info()['misses'] == 1
+    pipe.set_accepted()
+    assert pipe.cache.info()['size'] == 0
+
+    current.request = sdict(
+        query_params=sdict(
+            where='{"string":'
+        )
+    )
+    current.response = sdict()
+    res = await pipe.pipe_request(_fake_pipe, query=MongoQuery())
+    assert res == {'errors': {'where': 'invalid value'}}
+    assert pipe.cache.info()['size'] == 0